@@ -12,6 +12,70 @@ class Config(BLOXLINK_CONFIG):
 
     BOT_API_AUTH: str
 
+    # in-process guild settings and binds cache, per worker
+    GUILD_CACHE_SIZE: int = 10_000
+    GUILD_CACHE_TTL: float = 60.0
+
+    # guild_roles snapshots, addressed by guild_roles_hash: per worker, and shared in Redis
+    GUILD_ROLES_CACHE_SIZE: int = 2_000
+    GUILD_ROLES_CACHE_TTL: float = 3600.0
+    GUILD_ROLES_REDIS_TTL: int = 86400
+
+    # fraction of bind calculations also run through the sequential path to verify the compiled plan
+    BIND_PLAN_SHADOW_RATE: float = 0.0
+
+    # alt account and ban evasion restrictions: linked Discord accounts per Roblox account,
+    # the Redis set of each guild's bans, and the time restrictions may spend on both
+    LINKED_ACCOUNTS_TTL: float = 300.0
+    GUILD_BANS_TTL: int = 86400
+    GUILD_BANS_RETRY_AFTER: float = 30.0 # after a failed load of a guild's bans
+    LINKED_ACCOUNTS_TIMEOUT: float = 2.0
+
+    # memoized ageLimit and groupLock results, per worker
+    RESTRICTION_CACHE_SIZE: int = 50_000
+    RESTRICTION_CACHE_TTL: float = 300.0
+
+    # Roblox user sections, per worker and in Redis: seconds until each is refreshed, and how much
+    # longer a section may be served while it is refreshed in the background
+    ROBLOX_CACHE_SIZE: int = 50_000
+    ROBLOX_BASE_TTL: float = 300.0
+    ROBLOX_AVATARS_TTL: float = 3600.0
+    ROBLOX_GROUPS_TTL: float = 120.0
+    ROBLOX_BADGES_TTL: float = 900.0
+    ROBLOX_CACHE_MAX_STALE: float = 3600.0
+
+    # username -> Roblox ID lookups, and lookups of names that do not exist
+    ROBLOX_USERNAME_TTL: float = 86400.0
+    ROBLOX_USERNAME_MISS_TTL: float = 60.0
+
+    # how long the continuation_id of a page of badges can be used
+    ROBLOX_PAGE_CURSOR_TTL: float = 3600.0
+
+    # calls to Roblox from every worker: tokens per second (0 for no limit), the most that can
+    # build up, the tokens bulk work leaves for interactive calls, the longest a call without
+    # a deadline waits, the pause after a 429 without a usable Retry-After, and the most
+    # attempts of a call that keeps getting 429s
+    ROBLOX_RATE_LIMIT: float = 0.0
+    ROBLOX_RATE_BURST: float = 100.0
+    ROBLOX_RATE_BULK_RESERVE: float = 20.0
+    ROBLOX_RATE_MAX_WAIT: float = 10.0
+    ROBLOX_RATE_RETRY_AFTER: float = 1.0
+    ROBLOX_RATE_MAX_ATTEMPTS: int = 3
+
+    # seconds after which /api/users fetches a slow section a second time, 0 to never
+    ROBLOX_HEDGE_AFTER: float = 0.0
+
+    # /api/users/batch: the most users per request, and sections fetched at once per request
+    USER_BATCH_LIMIT: int = 10_000
+    USER_BATCH_CONCURRENCY: int = 20
+
+    # /api/binds and /api/restrictions batches: members calculated at once per request
+    MEMBER_BATCH_CONCURRENCY: int = 50
+
+    # compiled nickname templates, per worker, and the fraction also rendered with parse_template() to verify them
+    NICKNAME_TEMPLATE_CACHE_SIZE: int = 10_000
+    NICKNAME_TEMPLATE_SHADOW_RATE: float = 0.0
+
 CONFIG: Config = Config(
     **{field:value for field, value in environ.items() if field in Config.model_fields}
 )
@@ -2,24 +2,70 @@
 Endpoint for bind related endpoints
 """
 
-from typing import Optional
+import asyncio
+from typing import Optional, TypedDict
 
 from blacksheep.server.controllers import Controller, post
 from blacksheep import FromJSON
-from bloxlink_lib import RobloxUser, MemberSerializable, RoleSerializable, BaseModel, parse_template, SnowflakeSet
-from bloxlink_lib.database import fetch_guild_data
+from blacksheep.server.responses import json, not_modified
+from pydantic import model_validator
+from bloxlink_lib import RobloxUser, MemberSerializable, RoleSerializable, BaseModel
+from ..config import CONFIG
 from ..models import Response
-from ..lib.binds import filter_binds
+from ..binders import IfNoneMatchHeader
+from ..lib.binds import calculate_bind_changes, bind_fingerprint, MemberBindChanges, BIND_GUILD_DATA_FIELDS
+from ..lib.guild_data import expect_guild_data
+from ..lib.guild_roles import resolve_guild_roles
 
 
-class UpdateUserPayload(BaseModel):
-    guild_roles: dict[int, RoleSerializable]
+# returned when guild_roles_hash is unknown, so the caller sends guild_roles again
+UNKNOWN_GUILD_ROLES_STATUS = 409
+
+
+def unknown_guild_roles():
+    """The response to a guild_roles_hash that is not stored, asking for the roles themselves."""
+
+    return json(
+        Response(success=False, error="Unknown guild_roles_hash, send guild_roles instead"),
+        status=UNKNOWN_GUILD_ROLES_STATUS,
+    )
+
+
+class GuildRolesPayload(BaseModel):
+    """A payload with the roles of the guild.
+
+    Requests without either field fail validation with a 400 response. Only an unknown hash gets UNKNOWN_GUILD_ROLES_STATUS.
+    """
+
+    # the full roles, or the guildRolesHash of a previous response for the same roles
+    guild_roles: dict[int, RoleSerializable] | None = None
+    guild_roles_hash: str | None = None
+
+    @model_validator(mode="after")
+    def require_guild_roles(self) -> "GuildRolesPayload":
+        if self.guild_roles is None and not self.guild_roles_hash:
+            raise ValueError("Either guild_roles or guild_roles_hash is required")
+
+        return self
+
+
+class UpdateUserPayload(GuildRolesPayload):
     guild_name: str
     roblox_user: RobloxUser | None
     member: MemberSerializable
 
 
-class BindCalculationResponse(Response):
+class BatchMemberEntry(BaseModel):
+    member: MemberSerializable
+    roblox_user: RobloxUser | None = None
+
+
+class BatchUpdateUsersPayload(GuildRolesPayload):
+    guild_name: str
+    members: list[BatchMemberEntry]
+
+
+class MemberBindCalculation(TypedDict):
     nickname: str | None # nickname to set
 
     addRoles: list[int] # add these roles
@@ -27,6 +73,38 @@ class BindCalculationResponse(Response):
     missingRoles: list[str] # missing roles, created by bot
 
 
+class BindCalculationResponse(Response, MemberBindCalculation):
+    guildRolesHash: str # send as guild_roles_hash instead of guild_roles next time
+
+
+class BatchMemberBindCalculation(MemberBindCalculation):
+    userId: int
+
+
+class BatchBindCalculationResponse(Response):
+    results: list[BatchMemberBindCalculation]
+    guildRolesHash: str
+
+
+def serialize_changes(changes: MemberBindChanges) -> MemberBindCalculation:
+    """Convert the bind changes to the response format."""
+
+    return MemberBindCalculation(
+        nickname=changes.nickname,
+        addRoles=changes.add_roles,
+        removeRoles=changes.remove_roles,
+        missingRoles=changes.missing_roles,
+    )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches the ETag, comparing weakly."""
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    return "*" in tags or etag in tags
+
+
 class BindsController(Controller):
     @classmethod
     def route(cls) -> Optional[str]:
@@ -36,45 +114,85 @@ class BindsController(Controller):
     def class_name(cls) -> str:
         return "Bind Endpoints"
 
+    @post("/:guild_id/batch")
+    async def calculate_binds_for_users(self, guild_id: int, input: FromJSON[BatchUpdateUsersPayload]) -> BatchBindCalculationResponse:
+        """Calculates the binds for many members of one guild.
+
+        The guild data and binds are loaded once and shared by every member.
+        """
+
+        data = input.value
+
+        expect_guild_data(*BIND_GUILD_DATA_FIELDS)
+
+        role_index = await resolve_guild_roles(guild_id, data.guild_roles, data.guild_roles_hash)
+
+        if role_index is None:
+            return unknown_guild_roles()
+
+        member_limit = asyncio.Semaphore(CONFIG.MEMBER_BATCH_CONCURRENCY)
+
+        async def calculate(entry: BatchMemberEntry) -> BatchMemberBindCalculation:
+            async with member_limit:
+                changes = await calculate_bind_changes(
+                    guild_id,
+                    data.guild_name,
+                    role_index,
+                    entry.member,
+                    entry.roblox_user,
+                )
+
+            return BatchMemberBindCalculation(userId=entry.member.id, **serialize_changes(changes))
+
+        results = await asyncio.gather(*(calculate(entry) for entry in data.members))
+
+        return BatchBindCalculationResponse(success=True, results=list(results), guildRolesHash=role_index.roles_hash)
+
     @post("/:guild_id/:user_id")
-    async def calculate_binds_for_user(self, guild_id: int, user_id: int, input: FromJSON[UpdateUserPayload]) -> BindCalculationResponse:
-        """Calculates the binds for the user."""
+    async def calculate_binds_for_user(
+        self,
+        guild_id: int,
+        user_id: int,
+        input: FromJSON[UpdateUserPayload],
+        if_none_match: IfNoneMatchHeader = None,
+    ) -> BindCalculationResponse:
+        """Calculates the binds for the user.
+
+        The response has an ETag, and 304 is returned without calculating anything if
+        If-None-Match has it: nothing the calculation depends on has changed.
+        """
 
         data = input.value
-        roblox_user = data.roblox_user
-        member = data.member
-        guild_roles = data.guild_roles
-        guild_name = data.guild_name
-
-        bound_roles = BindCalculationResponse(
-            success=True,
-            nickname=None,
-            addRoles=[],
-            removeRoles=[],
-            missingRoles=[]
-        )
 
-        guild_data = await fetch_guild_data(
-            guild_id,
-            "allowOldRoles",
-        )
+        expect_guild_data(*BIND_GUILD_DATA_FIELDS)
 
-        potential_binds, remove_roles, missing_roles = await filter_binds(guild_id, roblox_user, member, guild_roles)
-        nickname = await parse_template(
-            guild_id=guild_id,
-            guild_name=guild_name,
-            potential_binds=potential_binds,
-            member=member,
-            roblox_user=roblox_user
-        )
+        role_index = await resolve_guild_roles(guild_id, data.guild_roles, data.guild_roles_hash)
+
+        if role_index is None:
+            return unknown_guild_roles()
 
-        if not guild_data.allowOldRoles:
-            bound_roles["removeRoles"] = list(remove_roles)
+        etag = await bind_fingerprint(guild_id, data.guild_name, role_index, data.member, data.roblox_user)
+
+        if etag:
+            etag = f'"{etag}"'
+
+            if if_none_match and if_none_match.value and etag_matches(if_none_match.value, etag):
+                response = not_modified()
+                response.add_header(b"ETag", etag.encode())
+
+                return response
+
+        changes = await calculate_bind_changes(
+            guild_id,
+            data.guild_name,
+            role_index,
+            data.member,
+            data.roblox_user,
+        )
 
-        bound_roles["addRoles"] = list(SnowflakeSet([role_id for bind in potential_binds for role_id in bind.roles]))
-        bound_roles["missingRoles"] = list(missing_roles)
-        bound_roles["nickname"] = nickname
+        response = self.json(BindCalculationResponse(success=True, guildRolesHash=role_index.roles_hash, **serialize_changes(changes)))
 
-        print(bound_roles)
+        if etag:
+            response.add_header(b"ETag", etag.encode())
 
-        return bound_roles
+        return response
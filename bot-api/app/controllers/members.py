@@ -0,0 +1,79 @@
+"""
+Endpoint for evaluating a member in one pass
+"""
+
+from typing import Optional
+
+from blacksheep.server.controllers import Controller, post
+from blacksheep import FromJSON
+from bloxlink_lib import RobloxUser, MemberSerializable
+from ..models import Response
+from ..lib.binds import calculate_bind_changes, BIND_GUILD_DATA_FIELDS
+from ..lib.restrictions import calculate_restrictions, RESTRICTION_GUILD_DATA_FIELDS
+from ..lib.guild_data import expect_guild_data
+from ..lib.guild_roles import resolve_guild_roles
+from .binds import GuildRolesPayload, MemberBindCalculation, serialize_changes, unknown_guild_roles
+
+
+# restriction actions that remove the member, making their roles and nickname irrelevant
+REMOVING_ACTIONS = ("kick", "ban")
+
+
+class EvaluateMemberPayload(GuildRolesPayload):
+    guild_name: str
+    roblox_user: RobloxUser | None = None
+    member: MemberSerializable
+
+
+class MemberEvaluationResponse(Response):
+    restrictions: dict
+    binds: MemberBindCalculation | None # None if the member is removed by a restriction
+    guildRolesHash: str
+
+
+class MembersController(Controller):
+    @classmethod
+    def route(cls) -> Optional[str]:
+        return "/api/members"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "Member Endpoints"
+
+    @post("/:guild_id/:user_id/evaluate")
+    async def evaluate_member(self, guild_id: int, user_id: int, input: FromJSON[EvaluateMemberPayload]) -> MemberEvaluationResponse:
+        """Evaluates the restrictions and the binds of the member together.
+
+        The guild data both need is read once. Binds are not calculated if the member is
+        restricted with an action that removes them from the guild.
+        """
+
+        data = input.value
+
+        expect_guild_data(*RESTRICTION_GUILD_DATA_FIELDS, *BIND_GUILD_DATA_FIELDS)
+
+        role_index = await resolve_guild_roles(guild_id, data.guild_roles, data.guild_roles_hash)
+
+        if role_index is None:
+            return unknown_guild_roles()
+
+        restrictions = await calculate_restrictions(guild_id=guild_id, roblox_user=data.roblox_user, user_id=user_id)
+
+        if restrictions.is_restricted and restrictions.action in REMOVING_ACTIONS:
+            binds = None
+        else:
+            changes = await calculate_bind_changes(
+                guild_id,
+                data.guild_name,
+                role_index,
+                data.member,
+                data.roblox_user,
+            )
+            binds = serialize_changes(changes)
+
+        return MemberEvaluationResponse(
+            success=True,
+            restrictions=restrictions.model_dump(),
+            binds=binds,
+            guildRolesHash=role_index.roles_hash,
+        )
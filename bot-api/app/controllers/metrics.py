@@ -0,0 +1,41 @@
+"""
+Endpoint for worker metrics
+"""
+
+from typing import Optional
+
+from blacksheep.server.controllers import Controller, get
+from ..models import Response
+from ..lib.cache import CACHES
+from ..lib.roblox_users import section_stats
+from ..lib.roblox_limiter import ROBLOX_LIMITER
+from ..lib.singleflight import FLIGHTS
+
+
+class MetricsResponse(Response):
+    caches: dict[str, dict]
+    roblox_users: dict[str, dict]
+    single_flights: dict[str, dict]
+    roblox_rate_limit: dict
+
+
+class MetricsController(Controller):
+    @classmethod
+    def route(cls) -> Optional[str]:
+        return "/api/metrics"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "Metrics"
+
+    @get("/")
+    async def worker_metrics(self) -> MetricsResponse:
+        """Metrics of this worker, such as the hit ratio, size and evictions of every cache."""
+
+        return MetricsResponse(
+            success=True,
+            caches={name: cache.stats() for name, cache in CACHES.items()},
+            roblox_users=section_stats(),
+            single_flights={name: flight.stats() for name, flight in FLIGHTS.items()},
+            roblox_rate_limit=ROBLOX_LIMITER.metrics(),
+        )
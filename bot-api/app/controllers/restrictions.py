@@ -2,20 +2,37 @@
 Endpoint for bot restriction related endpoints
 """
 
+import asyncio
 from typing import Optional
 
 from blacksheep.server.controllers import Controller, post
 from blacksheep import FromJSON
 from bloxlink_lib import RobloxUser, BaseModel
-from ..lib.restrictions import calculate_restrictions, RestrictedData
+from ..config import CONFIG
+from ..models import Response
+from ..lib.restrictions import calculate_restrictions, RestrictedData, RESTRICTION_GUILD_DATA_FIELDS
+from ..lib.guild_data import expect_guild_data
 
 
 class RestrictionPayload(BaseModel):
     roblox_user: RobloxUser | None = None
+    user_id: int | None = None # the Discord account, to check disallowAlts and disallowBanEvaders
+
+class BatchRestrictionEntry(BaseModel):
+    roblox_user: RobloxUser | None = None
+    user_id: int | None = None
+
+class BatchRestrictionPayload(BaseModel):
+    # either Roblox users alone, or entries with their Discord accounts
+    roblox_users: list[RobloxUser | None] = []
+    users: list[BatchRestrictionEntry] = []
 
 class RestrictionResponse(RestrictedData):
     success: bool = True
 
+class BatchRestrictionResponse(Response):
+    results: list[dict] # in the order of users or roblox_users
+
 
 class BindsController(Controller):
     @classmethod
@@ -35,9 +52,33 @@ class BindsController(Controller):
         data = input.value
         roblox_user = data.roblox_user
 
-        restrict_data = await calculate_restrictions(guild_id=guild_id, roblox_user=roblox_user)
+        restrict_data = await calculate_restrictions(guild_id=guild_id, roblox_user=roblox_user, user_id=data.user_id)
 
         return RestrictionResponse(
             success=True,
             **restrict_data.model_dump()
         )
+
+    @post("/evaluate/:guild_id/batch")
+    async def evaluate_restrictions_batch(self, guild_id: int, input: FromJSON[BatchRestrictionPayload]) -> BatchRestrictionResponse:
+        """
+        Calculates the restrictions for many users of one guild, reading its settings once.
+        """
+
+        data = input.value
+        entries = data.users or [BatchRestrictionEntry(roblox_user=roblox_user) for roblox_user in data.roblox_users]
+
+        expect_guild_data(*RESTRICTION_GUILD_DATA_FIELDS)
+
+        member_limit = asyncio.Semaphore(CONFIG.MEMBER_BATCH_CONCURRENCY)
+
+        async def calculate(entry: BatchRestrictionEntry) -> RestrictedData:
+            async with member_limit:
+                return await calculate_restrictions(guild_id=guild_id, roblox_user=entry.roblox_user, user_id=entry.user_id)
+
+        results = await asyncio.gather(*(calculate(entry) for entry in entries))
+
+        return BatchRestrictionResponse(
+            success=True,
+            results=[restrict_data.model_dump() for restrict_data in results]
+        )
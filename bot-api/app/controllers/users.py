@@ -3,19 +3,55 @@ Endpoint for user related endpoints
 """
 
 import asyncio
-from typing import Optional, Coroutine
+import json
+import logging
+from typing import Optional, Coroutine, AsyncIterable, Literal
 
-from blacksheep.server.controllers import Controller, get
-from blacksheep import FromQuery
-from bloxlink_lib import RobloxUser, fetch_roblox_id, fetch_base_data, fetch_user_groups, fetch_user_avatars, fetch_user_badges
+from blacksheep.server.controllers import Controller, get, post
+from blacksheep import FromQuery, FromJSON, Response as HTTPResponse, StreamedContent
+from bloxlink_lib import RobloxUser, BaseModel
+from domain.common import PageOptions, PaginatedSet
+from ..config import CONFIG
 from ..models import Response
 from ..binders import FromListQuery
+from ..lib.roblox_user_pages import fetch_badges_page, fetch_groups_page
+from ..lib.roblox_limiter import Priority, roblox_budget
+from ..lib.roblox_users import fetch_section, fetch_section_hedged, resolve_roblox_id, fetch_users_bulk, BULK_CHUNK_SIZE
 
 
 class UserDataResponse(Response):
     user: RobloxUser | None
 
 
+class UserPageResponse(Response):
+    items: list[dict]
+    total: int | None
+    continuation_id: int | None # pass to get the next page, None on the last page
+
+
+# status of each section in the "sections" field of retrieve_user_info
+SectionStatus = Literal["ok", "error", "timeout"]
+
+
+class BatchUsersPayload(BaseModel):
+    ids: list[int] = []
+    usernames: list[str] = []
+    include: list[str] = [] # any of base, avatars, groups, badges
+    resolve_avatars: bool = False
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _page_response(page: PaginatedSet[dict]) -> UserPageResponse:
+    return UserPageResponse(success=True, items=page.items, total=page.total, continuation_id=page.continuation_id)
+
+
+def _ndjson_line(data: dict) -> bytes:
+    return json.dumps(data, default=str).encode() + b"\n"
+
+
 class UserInfoController(Controller):
     @classmethod
     def route(cls) -> Optional[str]:
@@ -32,22 +68,40 @@ class UserInfoController(Controller):
                                  include: FromListQuery = None,
                                  timeout: FromQuery[float] = None,
                                  resolve_avatars: FromQuery[bool] = False,
+                                 cache: FromQuery[bool] = None,
                                  ) -> RobloxUser | Response:
-        """Retrieves the information of the Roblox user."""
+        """Retrieves the information of the Roblox user.
+
+        Sections are served from the cache, even if stale, unless cache=false is passed.
+
+        The timeout is a budget for the whole request, resolving the username included. Sections
+        not done by then are cancelled, and the "sections" field says which sections are "ok",
+        "error" or "timeout", so the ones that finished are returned either way. Sections still
+        running after ROBLOX_HEDGE_AFTER seconds are fetched a second time, if it is set.
+        """
 
         roblox_name: str = username.value if username else None
         roblox_id: int = id.value if id else None
         include: list[str] = include.value if include else ["everything"]
         timeout: float = timeout.value if timeout else None
+        resolve_avatars: bool = resolve_avatars.value if resolve_avatars else False
+        use_cache: bool = cache.value if cache else True
 
         roblox_data: RobloxUser = None
 
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+
         if not (roblox_name or roblox_id) or (roblox_name and roblox_id):
             return Response(success=False, error="Must provide either a Roblox name or ID")
         
         if not roblox_id:
             # fetch Roblox ID from provided username
-            roblox_id = await fetch_roblox_id(roblox_name)
+            try:
+                with roblox_budget(deadline=deadline):
+                    roblox_id = await asyncio.wait_for(resolve_roblox_id(roblox_name), timeout)
+            except asyncio.TimeoutError:
+                return Response(success=False, error="Timed out looking up the Roblox user")
 
             if not roblox_id:
                 return Response(success=False, error="No Roblox user found")
@@ -55,25 +109,178 @@ class UserInfoController(Controller):
         roblox_data = RobloxUser(username=roblox_name,
                                  id=roblox_id,
                                  profile_link=f"https://www.roblox.com/users/{roblox_id}/profile")
-        
-        http_tasks: list[Coroutine] = [
-            fetch_base_data(roblox_id),
-            fetch_user_avatars(roblox_id, resolve_avatars)
-        ]
+
+        def section(name: str, *key) -> Coroutine:
+            if CONFIG.ROBLOX_HEDGE_AFTER:
+                return fetch_section_hedged(name, *key, use_cache=use_cache, hedge_after=CONFIG.ROBLOX_HEDGE_AFTER)
+
+            return fetch_section(name, *key, use_cache=use_cache)
+
+        http_tasks: dict[str, Coroutine] = {
+            "base": section("base", roblox_id),
+            "avatars": section("avatars", roblox_id, resolve_avatars),
+        }
 
         if "groups" in include or "everything" in include:
-            http_tasks.append(fetch_user_groups(roblox_id))
+            http_tasks["groups"] = section("groups", roblox_id)
 
         if "badges" in include or "everything" in include:
-            http_tasks.append(fetch_user_badges(roblox_id))
+            http_tasks["badges"] = section("badges", roblox_id)
+
+        with roblox_budget(deadline=deadline):
+            tasks = {name: asyncio.create_task(task) for name, task in http_tasks.items()}
+
+        _, pending = await asyncio.wait(tasks.values(), timeout=max(deadline - loop.time(), 0) if deadline else None)
+
+        # nobody is waiting for these anymore
+        for task in pending:
+            task.cancel()
+
+        statuses: dict[str, SectionStatus] = {}
+
+        for name, task in tasks.items():
+            if task in pending:
+                statuses[name] = "timeout"
+            elif task.exception():
+                logging.warning(f"Fetching the {name} of Roblox user {roblox_id} failed: {task.exception()!r}")
+                statuses[name] = "error"
+            else:
+                statuses[name] = "ok"
+
+                for key, value in task.result().items():
+                    setattr(roblox_data, key, value)
+
+        return {**roblox_data.model_dump(by_alias=True, exclude_unset=True), "sections": statuses}
+
+    @get("/:roblox_id/badges")
+    async def retrieve_user_badges(self, roblox_id: int, page_options: PageOptions) -> UserPageResponse | Response:
+        """Retrieves a page of the badges of the Roblox user, after continuation_id.
+
+        Only the Roblox pages needed for it are fetched. The total is always null.
+        """
+
+        try:
+            page = await fetch_badges_page(roblox_id, page_options)
+        except RuntimeError as e:
+            logging.warning(e)
+            return self.json(Response(success=False, error="An error occured while fetching the Roblox user data."), status=502)
+
+        if page is None:
+            return self.json(Response(success=False, error="Unknown or expired continuation_id, start from the first page"), status=400)
+
+        return _page_response(page)
+
+    @get("/:roblox_id/groups")
+    async def retrieve_user_groups(self, roblox_id: int, page_options: PageOptions) -> UserPageResponse | Response:
+        """Retrieves a page of the groups of the Roblox user, ordered by group ID, after continuation_id."""
+
+        try:
+            page = await fetch_groups_page(roblox_id, page_options)
+        except RuntimeError as e:
+            logging.warning(e)
+            return self.json(Response(success=False, error="An error occured while fetching the Roblox user data."), status=502)
+
+        return _page_response(page)
+
+    @post("/batch")
+    async def retrieve_users_batch(self, input: FromJSON[BatchUsersPayload]) -> HTTPResponse:
+        """Retrieves many Roblox users by ID or username, streamed as NDJSON.
+
+        IDs and usernames are resolved with Roblox's bulk APIs, BULK_CHUNK_SIZE per call, which
+        also give each user's name and display name. Sections in include are then fetched per
+        user through the cache. Every line is a UserDataResponse, or an error for one ID or
+        username, in the order the users are ready.
+        """
+
+        data = input.value
+        include = set(data.include)
+
+        if len(data.ids) + len(data.usernames) > CONFIG.USER_BATCH_LIMIT:
+            return self.json(Response(success=False, error=f"At most {CONFIG.USER_BATCH_LIMIT} users can be requested at once"), status=400)
+
+        section_limit = asyncio.Semaphore(CONFIG.USER_BATCH_CONCURRENCY)
+
+        async def build_user(found: dict) -> bytes:
+            roblox_id = found["id"]
+            roblox_data = RobloxUser(username=found["name"],
+                                     id=roblox_id,
+                                     display_name=found["displayName"],
+                                     profile_link=f"https://www.roblox.com/users/{roblox_id}/profile")
+
+            http_tasks: list[Coroutine] = []
+
+            if "base" in include:
+                http_tasks.append(fetch_section("base", roblox_id))
+
+            if "avatars" in include:
+                http_tasks.append(fetch_section("avatars", roblox_id, data.resolve_avatars))
+
+            if "groups" in include:
+                http_tasks.append(fetch_section("groups", roblox_id))
+
+            if "badges" in include:
+                http_tasks.append(fetch_section("badges", roblox_id))
+
+            try:
+                async with section_limit:
+                    sections = await asyncio.gather(*http_tasks)
+            except Exception as e: # pylint: disable=broad-except
+                logging.warning(f"Fetching Roblox user {roblox_id} failed: {e!r}")
+                return _ndjson_line({"success": False, "id": roblox_id, "error": "An error occured while fetching the Roblox user data."})
+
+            for section in sections:
+                for key, value in section.items():
+                    setattr(roblox_data, key, value)
+
+            return _ndjson_line({"success": True, "user": roblox_data.model_dump(mode="json", by_alias=True, exclude_unset=True)})
+
+        async def lookup_chunk(queue: asyncio.Queue, ids: list[int] | None, usernames: list[str] | None):
+            try:
+                found_users = await fetch_users_bulk(ids=ids, usernames=usernames)
+            except Exception as e: # pylint: disable=broad-except
+                logging.warning(f"Bulk Roblox user lookup failed: {e!r}")
+
+                for missing in ids or usernames:
+                    await queue.put(_ndjson_line({"success": False, ("id" if ids else "username"): missing, "error": "An error occured while fetching the Roblox user data."}))
+
+                return
+
+            if usernames:
+                found_names = {found["requestedUsername"].lower() for found in found_users}
+                missing_users = [("username", username) for username in usernames if username.lower() not in found_names]
+            else:
+                found_ids = {found["id"] for found in found_users}
+                missing_users = [("id", roblox_id) for roblox_id in ids if roblox_id not in found_ids]
+
+            for field, value in missing_users:
+                await queue.put(_ndjson_line({"success": False, field: value, "error": "No Roblox user found"}))
+
+            async def emit(found: dict):
+                await queue.put(await build_user(found))
+
+            await asyncio.gather(*(emit(found) for found in found_users))
+
+        async def stream() -> AsyncIterable[bytes]:
+            queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+            lookups = [
+                *(lookup_chunk(queue, chunk, None) for chunk in _chunks(list(dict.fromkeys(data.ids)), BULK_CHUNK_SIZE)),
+                *(lookup_chunk(queue, None, chunk) for chunk in _chunks(list(dict.fromkeys(data.usernames)), BULK_CHUNK_SIZE)),
+            ]
 
-        done, _ = await asyncio.wait([asyncio.create_task(task) for task in http_tasks], timeout=timeout)
+            async def run_lookups():
+                try:
+                    with roblox_budget(Priority.BULK):
+                        await asyncio.gather(*lookups)
+                finally:
+                    await queue.put(None)
 
-        for task in done:
-            if task.exception():
-                return Response(success=False, error="An error occured while fetching the Roblox user data.")
+            producer = asyncio.create_task(run_lookups())
 
-            for key, value in task.result().items():
-                setattr(roblox_data, key, value)
+            try:
+                while (line := await queue.get()) is not None:
+                    yield line
+            finally:
+                # the client went away before the end
+                producer.cancel()
 
-        return roblox_data.model_dump(by_alias=True, exclude_unset=True)
+        return HTTPResponse(200, content=StreamedContent(b"application/x-ndjson", stream))
@@ -0,0 +1,195 @@
+"""
+Bind evaluation plans, compiled once per version of a guild's binds.
+"""
+
+import hashlib
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import islice
+
+from bloxlink_lib import GuildBind, RobloxUser
+
+
+__all__ = ("BindPlan",)
+
+LOWEST_RANK = 0
+HIGHEST_RANK = 255
+
+
+def _rank_intervals(bind: GuildBind) -> list[tuple[int, int]] | None:
+    """The rank intervals a group member must be in for the bind to apply.
+
+    The conditions of a group bind are alternatives: everyone, an exact roleset (or "this rank
+    and above" when negative) and a min/max range. Returns None for binds the plan cannot
+    express, which are then evaluated with GuildBind.satisfies_for().
+    """
+
+    group_data = bind.criteria.group
+
+    if group_data is None or group_data.dynamicRoles:
+        return None
+
+    intervals: list[tuple[int, int]] = []
+
+    if group_data.everyone:
+        intervals.append((LOWEST_RANK, HIGHEST_RANK))
+
+    if group_data.roleset:
+        roleset = group_data.roleset
+        intervals.append((abs(roleset), HIGHEST_RANK) if roleset < 0 else (roleset, roleset))
+
+    if group_data.min is not None or group_data.max is not None:
+        intervals.append((
+            group_data.min if group_data.min is not None else LOWEST_RANK,
+            group_data.max if group_data.max is not None else HIGHEST_RANK,
+        ))
+
+    if not intervals and not group_data.guest:
+        return None
+
+    return intervals
+
+
+class BindPlan:
+    """The binds of a guild, compiled into lookup tables.
+
+    Verified and unverified binds are decided from whether the member is verified. Group binds
+    are indexed by group ID as sorted rank intervals, so matching a member costs lookups in
+    proportion to the member's groups instead of the number of binds. Guest binds are indexed
+    by group ID too. Everything else (dynamic group roles, badges, gamepasses, assets) falls
+    back to GuildBind.satisfies_for().
+
+    The plan and its binds are shared between requests and must not be modified.
+    """
+
+    def __init__(self, binds: list[GuildBind]):
+        self.binds = binds
+
+        # identifies this version of the binds across workers
+        self.version = hashlib.sha256(
+            json.dumps([bind.model_dump(mode="json") for bind in binds], sort_keys=True).encode()
+        ).hexdigest()
+
+        self.verified: list[int] = []
+        self.unverified: list[int] = []
+        self.fallback: list[int] = []
+
+        # group ID -> intervals as (low, high, bind index), sorted by low, and the lows for bisecting
+        self.group_intervals: dict[int, list[tuple[int, int, int]]] = defaultdict(list)
+        self.group_interval_lows: dict[int, list[int]] = {}
+        self.group_guests: dict[int, list[int]] = defaultdict(list)
+
+        # role IDs of every bind as integers, converted once
+        self.bind_roles: list[tuple[int, ...]] = [tuple(int(role_id) for role_id in bind.roles) for bind in binds]
+        self.bind_remove_roles: list[tuple[int, ...]] = [tuple(int(role_id) for role_id in bind.remove_roles) for bind in binds]
+
+        # role ID -> indices of the binds that give the role
+        self.role_binds: dict[int, list[int]] = defaultdict(list)
+
+        for index, bind in enumerate(binds):
+            for role_id in self.bind_roles[index]:
+                self.role_binds[role_id].append(index)
+
+            match bind.type:
+                case "verified":
+                    self.verified.append(index)
+                case "unverified":
+                    self.unverified.append(index)
+                case "group":
+                    intervals = _rank_intervals(bind)
+
+                    if intervals is None:
+                        self.fallback.append(index)
+                        continue
+
+                    group_id = int(bind.criteria.id)
+
+                    for low, high in intervals:
+                        self.group_intervals[group_id].append((low, high, index))
+
+                    if bind.criteria.group.guest:
+                        self.group_guests[group_id].append(index)
+                case _:
+                    self.fallback.append(index)
+
+        for group_id, intervals in self.group_intervals.items():
+            intervals.sort()
+            self.group_interval_lows[group_id] = [low for low, _, _ in intervals]
+
+        self.group_intervals = dict(self.group_intervals)
+        self.group_guests = dict(self.group_guests)
+        self.role_binds = dict(self.role_binds)
+
+    def static_matches(
+        self,
+        roblox_user: RobloxUser | None,
+        verified_role_enabled: bool,
+        unverified_role_enabled: bool,
+    ) -> tuple[set[int], set[int]]:
+        """Match every bind that does not need satisfies_for().
+
+        Returns the indices of the binds that apply, and of the binds that are skipped
+        entirely (verified or unverified binds whose setting is disabled). Guest binds of
+        unverified users are left to the fallback, see fallback_for().
+        """
+
+        applies: set[int] = set()
+        skipped: set[int] = set()
+
+        if not verified_role_enabled:
+            skipped.update(self.verified)
+        elif roblox_user:
+            applies.update(self.verified)
+
+        if not unverified_role_enabled:
+            skipped.update(self.unverified)
+        elif not roblox_user:
+            applies.update(self.unverified)
+
+        if not roblox_user:
+            return applies, skipped
+
+        for group_id, guest_binds in self.group_guests.items():
+            if group_id not in roblox_user.groups:
+                applies.update(guest_binds)
+
+        for group_id, group in roblox_user.groups.items():
+            intervals = self.group_intervals.get(int(group_id))
+
+            if not intervals:
+                continue
+
+            rank = group.role.rank
+            candidates = bisect_right(self.group_interval_lows[int(group_id)], rank)
+
+            for low, high, index in islice(intervals, candidates):
+                if low <= rank <= high:
+                    applies.add(index)
+
+        return applies, skipped
+
+    def fallback_for(self, roblox_user: RobloxUser | None) -> list[int]:
+        """Indices of the binds to evaluate with satisfies_for() for this user."""
+
+        if roblox_user:
+            return self.fallback
+
+        return sorted((*self.fallback, *(index for binds in self.group_guests.values() for index in binds)))
+
+    @property
+    def is_deterministic(self) -> bool:
+        """Whether the result only depends on the member, the Roblox user and the guild.
+
+        Badge, gamepass and asset binds look up ownership on Roblox, so their result can change at any time.
+        """
+
+        return all(self.binds[index].type == "group" for index in self.fallback)
+
+    @property
+    def has_verified_bind(self) -> bool:
+        return bool(self.verified)
+
+    @property
+    def has_unverified_bind(self) -> bool:
+        return bool(self.unverified)
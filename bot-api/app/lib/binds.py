@@ -1,38 +1,163 @@
-from bloxlink_lib import GuildBind, RobloxUser, MemberSerializable, RoleSerializable, get_binds, SnowflakeSet, CoerciveSet, find
-from bloxlink_lib.database import fetch_guild_data
+import asyncio
+import hashlib
+import logging
+import random
+from dataclasses import dataclass
 
+from bloxlink_lib import GuildBind, GuildData, RobloxUser, MemberSerializable, find
+from ..config import CONFIG
+from .guild_data import load_guild_data, load_bind_plan
+from .role_index import RoleIndex
+from .bind_plan import BindPlan
+from .nickname_templates import render_nickname
 
-async def filter_binds(guild_id: int, roblox_user: RobloxUser | None, member: MemberSerializable, guild_roles: dict[int, RoleSerializable]) -> tuple[list[GuildBind], SnowflakeSet, CoerciveSet[str]]:
-    """Filter the binds that apply to the user."""
 
-    successful_binds: list[GuildBind] = []
-    remove_roles = SnowflakeSet()
-    missing_roles = CoerciveSet(str)
+# guild data read by the bind calculation, for GuildDataLoader.expect()
+BIND_GUILD_DATA_FIELDS = (
+    "allowOldRoles",
+    "verifiedRoleEnabled",
+    "unverifiedRoleEnabled",
+    "nicknameTemplate",
+    "unverifiedNickname",
+)
 
-    guild_data = await fetch_guild_data(guild_id, "verifiedRoleEnabled", "unverifiedRoleEnabled")
-    binds = await get_binds(guild_id, guild_roles=guild_roles)
+
+@dataclass(slots=True)
+class BindResult:
+    """A bind that applies to a member.
+
+    Binds are shared between requests and never modified, so what is specific to the member,
+    such as the roles added by dynamic group binds, is kept here instead.
+    """
+
+    bind: GuildBind
+    roles: list[int]
+    highest_role: int | None
+
+
+@dataclass(slots=True)
+class MemberBindChanges:
+    """The role and nickname changes for one member."""
+
+    add_roles: list[int]
+    remove_roles: list[int]
+    missing_roles: list[str]
+    nickname: str | None
+
+
+async def filter_binds(
+    guild_id: int,
+    roblox_user: RobloxUser | None,
+    member: MemberSerializable,
+    role_index: RoleIndex,
+) -> tuple[list[BindResult], set[int], set[str]]:
+    """Filter the binds that apply to the user.
+
+    Binds are matched through the guild's compiled BindPlan. Only binds the plan cannot
+    express are evaluated with satisfies_for(). The binds themselves are not modified.
+    Returns the results, the IDs of the roles to remove and the names of the roles to create.
+    """
+
+    results: list[BindResult] = []
+    remove_roles: set[int] = set()
+    missing_roles: set[str] = set()
+
+    guild_data = await load_guild_data(guild_id, "verifiedRoleEnabled", "unverifiedRoleEnabled")
+    plan = await load_bind_plan(guild_id, role_index)
+    binds = plan.binds
+    guild_roles = role_index.roles
 
     verified_role_enabled = guild_data.verifiedRoleEnabled
     unverified_role_enabled = guild_data.unverifiedRoleEnabled
 
-    for bind in binds:
+    if CONFIG.BIND_PLAN_SHADOW_RATE and random.random() < CONFIG.BIND_PLAN_SHADOW_RATE:
+        shadow = asyncio.create_task(_filter_binds_sequential(
+            plan, roblox_user, member, role_index, verified_role_enabled, unverified_role_enabled,
+        ))
+    else:
+        shadow = None
+
+    # the shadow must not outlive the request, nor fail it
+    try:
+        applies, skipped = plan.static_matches(roblox_user, verified_role_enabled, unverified_role_enabled)
+        fallback = [index for index in plan.fallback_for(roblox_user) if index not in skipped]
+        fallback_results = await asyncio.gather(*(binds[index].satisfies_for(guild_roles, member, roblox_user) for index in fallback))
+        fallback_roles: dict[int, tuple[list[int], list[str]]] = {}
+
+        for index, (bind_applies, bind_additional_roles, bind_missing_roles, bind_ineligible_roles) in zip(fallback, fallback_results):
+            if bind_applies:
+                applies.add(index)
+                fallback_roles[index] = ([int(role_id) for role_id in bind_additional_roles], bind_missing_roles)
+
+            remove_roles.update(int(role_id) for role_id in bind_ineligible_roles)
+
+        for index in sorted(applies):
+            bind_additional_roles, bind_missing_roles = fallback_roles.get(index, ((), ()))
+            roles = [*plan.bind_roles[index], *bind_additional_roles]
+
+            results.append(BindResult(bind=binds[index], roles=roles, highest_role=role_index.highest(roles)))
+            remove_roles.update(plan.bind_remove_roles[index])
+            missing_roles.update(bind_missing_roles)
+
+        # roles the member has from binds that do not apply
+        for role_id in member.role_ids:
+            for index in plan.role_binds.get(role_id, ()):
+                if index not in applies and index not in skipped:
+                    remove_roles.add(role_id)
+                    break
+
+        # create any missing verified/unverified roles
+        if roblox_user and verified_role_enabled and not plan.has_verified_bind:
+            missing_roles.add("Verified")
+        elif not roblox_user and unverified_role_enabled and not plan.has_unverified_bind:
+            missing_roles.add("Unverified")
+
+        # roles deleted from the guild cannot be removed
+        remove_roles &= role_index.role_ids
+
+        if shadow:
+            try:
+                _compare_with_shadow(guild_id, sorted(applies), remove_roles, missing_roles, await shadow)
+            except Exception as e: # pylint: disable=broad-except
+                logging.warning(f"Comparing the bind plan of guild {guild_id} with the sequential path failed: {e!r}")
+    finally:
+        if shadow:
+            shadow.cancel()
+
+    return results, remove_roles, missing_roles
+
+
+async def _filter_binds_sequential(
+    plan: BindPlan,
+    roblox_user: RobloxUser | None,
+    member: MemberSerializable,
+    role_index: RoleIndex,
+    verified_role_enabled: bool,
+    unverified_role_enabled: bool,
+) -> tuple[list[int], set[int], set[str]]:
+    """The bind filter without a plan: every bind is checked with satisfies_for().
+
+    Kept as the reference the compiled plan is verified against. Returns the indices of the binds that apply.
+    """
+
+    successful_binds: list[int] = []
+    remove_roles: set[int] = set()
+    missing_roles: set[str] = set()
+    binds = plan.binds
+
+    for index, bind in enumerate(binds):
         if (bind.type == "verified" and not verified_role_enabled) or (bind.type == "unverified" and not unverified_role_enabled):
             continue
 
-        bind_applies, bind_additional_roles, bind_missing_roles, bind_ineligible_roles = await bind.satisfies_for(guild_roles, member, roblox_user)
+        bind_applies, _, bind_missing_roles, bind_ineligible_roles = await bind.satisfies_for(role_index.roles, member, roblox_user)
+        remove_roles.update(int(role_id) for role_id in bind_ineligible_roles)
 
         if bind_applies:
-            bind.roles.extend([str(x) for x in bind_additional_roles])
-            successful_binds.append(bind)
-            remove_roles.update(bind.remove_roles, bind_ineligible_roles)
+            successful_binds.append(index)
+            remove_roles.update(plan.bind_remove_roles[index])
             missing_roles.update(bind_missing_roles)
-            bind.calculate_highest_role(guild_roles)
         else:
-            remove_roles.update(bind_ineligible_roles)
-
-            for role_id in bind.roles:
-                if int(role_id) in member.role_ids:
-                    remove_roles.add(role_id)
+            remove_roles.update(role_id for role_id in plan.bind_roles[index] if role_id in member.role_ids)
 
     # create any missing verified/unverified roles
     if roblox_user and verified_role_enabled and not find(lambda b: b.type == "verified", binds):
@@ -40,4 +165,111 @@ async def filter_binds(guild_id: int, roblox_user: RobloxUser | None, member: Me
     elif not roblox_user and unverified_role_enabled and not find(lambda b: b.type == "unverified", binds):
         missing_roles.add("Unverified")
 
-    return successful_binds, remove_roles, missing_roles
+    return successful_binds, remove_roles & role_index.role_ids, missing_roles
+
+
+def _compare_with_shadow(
+    guild_id: int,
+    successful_indices: list[int],
+    remove_roles: set[int],
+    missing_roles: set[str],
+    shadow_result: tuple[list[int], set[int], set[str]],
+):
+    """Log any difference between the compiled plan and the sequential path."""
+
+    shadow_indices, shadow_remove_roles, shadow_missing_roles = shadow_result
+
+    if (
+        successful_indices != shadow_indices
+        or remove_roles != shadow_remove_roles
+        or missing_roles != shadow_missing_roles
+    ):
+        logging.error(
+            f"Bind plan mismatch for guild {guild_id}: "
+            f"binds {successful_indices} != {shadow_indices}, "
+            f"remove roles {sorted(remove_roles)} != {sorted(shadow_remove_roles)}, "
+            f"missing roles {sorted(missing_roles)} != {sorted(shadow_missing_roles)}"
+        )
+
+
+async def bind_fingerprint(
+    guild_id: int,
+    guild_name: str,
+    role_index: RoleIndex,
+    member: MemberSerializable,
+    roblox_user: RobloxUser | None,
+) -> str | None:
+    """A fingerprint of everything calculate_bind_changes() depends on, for use as an ETag.
+
+    It only needs the cached guild data and bind plan. Returns None if the result can change
+    without any of its inputs changing, see BindPlan.is_deterministic.
+    """
+
+    guild_data = await load_guild_data(guild_id, *BIND_GUILD_DATA_FIELDS)
+    plan = await load_bind_plan(guild_id, role_index)
+
+    if not plan.is_deterministic or role_index.roles_hash is None:
+        return None
+
+    fingerprint = hashlib.sha256()
+
+    for part in (
+        plan.version,
+        role_index.roles_hash,
+        guild_name,
+        guild_data.model_dump_json(include=set(BIND_GUILD_DATA_FIELDS)),
+        member.model_dump_json(),
+        roblox_user.model_dump_json() if roblox_user else "",
+    ):
+        fingerprint.update(part.encode())
+        fingerprint.update(b"\0")
+
+    return fingerprint.hexdigest()
+
+
+def nickname_template(
+    results: list[BindResult],
+    role_index: RoleIndex,
+    guild_data: GuildData,
+    roblox_user: RobloxUser | None,
+) -> str | None:
+    """The nickname template for the member.
+
+    The nickname of the applying bind with the highest role is used if it has one, otherwise the guild's template.
+    """
+
+    highest_result = max(
+        (result for result in results if result.highest_role is not None),
+        key=lambda result: role_index.positions[result.highest_role],
+        default=None,
+    )
+
+    if highest_result and highest_result.bind.nickname:
+        return highest_result.bind.nickname
+
+    return guild_data.nicknameTemplate if roblox_user else guild_data.unverifiedNickname
+
+
+async def calculate_bind_changes(
+    guild_id: int,
+    guild_name: str,
+    role_index: RoleIndex,
+    member: MemberSerializable,
+    roblox_user: RobloxUser | None,
+) -> MemberBindChanges:
+    """Calculate the roles to add and remove and the nickname for the member."""
+
+    guild_data = await load_guild_data(guild_id, *BIND_GUILD_DATA_FIELDS)
+
+    results, remove_roles, missing_roles = await filter_binds(guild_id, roblox_user, member, role_index)
+
+    template = nickname_template(results, role_index, guild_data, roblox_user)
+
+    nickname = await render_nickname(guild_id, guild_name, template, member, roblox_user)
+
+    return MemberBindChanges(
+        add_roles=list(dict.fromkeys(role_id for result in results for role_id in result.roles)),
+        remove_roles=[] if guild_data.allowOldRoles else list(remove_roles),
+        missing_roles=list(missing_roles),
+        nickname=nickname,
+    )
@@ -0,0 +1,105 @@
+"""
+Bounded in-process caches, local to each bot-api worker.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+
+__all__ = ("TTLCache", "CACHES")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+CACHES: dict[str, "TTLCache"] = {}
+
+
+class TTLCache(Generic[K, V]):
+    """A least-recently-used cache holding at most `maxsize` entries, each expiring after `ttl` seconds.
+
+    Every cache registers itself in CACHES by name so its statistics can be exposed.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+        CACHES[name] = self
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Get a value, counting a hit or a miss."""
+
+        entry = self._entries.get(key, _MISSING)
+
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        """Store a value, evicting the least recently used entry if the cache is full."""
+
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K):
+        """Remove a key if it is cached."""
+
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[K], bool]):
+        """Remove every key matching the predicate."""
+
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        """Remove everything."""
+
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Statistics for the metrics endpoint."""
+
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,146 @@
+"""
+Group locks compiled into rank interval matchers, once per version of a guild's settings.
+"""
+
+import hashlib
+import json
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any
+
+import pydantic_core
+from bloxlink_lib import RobloxUser
+from ..config import CONFIG
+from .cache import TTLCache
+
+
+__all__ = ("GroupLockMatcher", "LockedGroup", "get_group_lock_matcher")
+
+HIGHEST_RANK = 255
+
+
+def _merge_intervals(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+
+    return merged
+
+
+@dataclass(slots=True)
+class LockedGroup:
+    """One group of the group lock. The text of its restriction is built once."""
+
+    group_id: int
+    action: str | None
+    dm_message: str
+    not_in_group_suffix: str
+    rank_suffix: str | None
+
+    # disjoint rank intervals sorted by their lows, None if any rank is allowed
+    intervals: list[tuple[int, int]] | None
+    lows: list[int]
+
+    def allows_rank(self, rank: int) -> bool:
+        if self.intervals is None:
+            return True
+
+        index = bisect_right(self.lows, rank) - 1
+
+        return index >= 0 and rank <= self.intervals[index][1]
+
+
+class GroupLockMatcher:
+    """The groupLock setting of a guild, compiled.
+
+    Required rolesets are kept in three encodings: [min, max] ranges, exact ranks and
+    negative ranks meaning "this rank or higher". All of them become one sorted list of
+    disjoint rank intervals per group, so a rank is checked with a single bisect.
+    """
+
+    def __init__(self, group_lock: dict[Any, Any]):
+        # the same for the same settings, however often they are read and in every worker
+        self.version = hashlib.sha256(
+            json.dumps(pydantic_core.to_jsonable_python(group_lock), sort_keys=True).encode()
+        ).hexdigest()
+        self.groups: list[LockedGroup] = []
+        self.kick_unverified = any(lock.unverifiedAction == "kick" for lock in group_lock.values())
+
+        for group_id, lock in group_lock.items():
+            dm_message = lock.dmMessage or ""
+
+            if dm_message:
+                dm_message = f"\n\n**The following text is from the server admins:**" \
+                    f"\n>{dm_message} "
+
+            group_link = f"[{lock.groupName}](<https://www.roblox.com/groups/{group_id}>)"
+            intervals: list[tuple[int, int]] = []
+
+            for roleset in lock.roleSets or ():
+                if isinstance(roleset, list):
+                    if roleset[0] <= roleset[1]:
+                        intervals.append((roleset[0], roleset[1]))
+                elif roleset < 0:
+                    intervals.append((abs(roleset), HIGHEST_RANK))
+                else:
+                    intervals.append((roleset, roleset))
+
+            intervals = _merge_intervals(intervals) if lock.roleSets else None
+
+            self.groups.append(LockedGroup(
+                group_id=int(group_id),
+                action=lock.verifiedAction,
+                dm_message=dm_message,
+                not_in_group_suffix=f"this server requires users to be in {group_link}",
+                # the last required roleset is named, as before
+                rank_suffix=f"this server requires users have rank **{lock.roleSets[-1]} or higher** in {group_link}" if lock.roleSets else None,
+                intervals=intervals,
+                lows=[low for low, _ in intervals] if intervals else [],
+            ))
+
+    def ranks_of(self, roblox_user: RobloxUser) -> tuple[int | None, ...]:
+        """The user's rank in each locked group, None where they are not in it."""
+
+        return tuple(
+            group_match.role.rank if (group_match := roblox_user.groups.get(group.group_id)) else None
+            for group in self.groups
+        )
+
+    def first_failure(self, roblox_user: RobloxUser) -> tuple[LockedGroup, bool] | None:
+        """The first group the user does not satisfy, and whether they are in it at all."""
+
+        for group in self.groups:
+            group_match = roblox_user.groups.get(group.group_id)
+
+            if not group_match:
+                return group, False
+
+            if not group.allows_rank(group_match.role.rank):
+                return group, True
+
+        return None
+
+
+# keyed by guild, with the groupLock object the matcher was compiled from: a new read of the settings is a new object
+MATCHER_CACHE: TTLCache[int, tuple[Any, GroupLockMatcher]] = TTLCache(
+    "group_lock_matchers", CONFIG.GUILD_CACHE_SIZE, CONFIG.GUILD_CACHE_TTL
+)
+
+
+def get_group_lock_matcher(guild_id: int, group_lock: dict[Any, Any]) -> GroupLockMatcher:
+    """Compile the guild's group lock, or get it from the worker cache if it has not changed."""
+
+    compiled_from, matcher = MATCHER_CACHE.get(guild_id, (None, None))
+
+    if matcher is None or compiled_from is not group_lock:
+        # settings read again but unchanged keep their matcher
+        if matcher is None or compiled_from != group_lock:
+            matcher = GroupLockMatcher(group_lock)
+
+        MATCHER_CACHE.set(guild_id, (group_lock, matcher))
+
+    return matcher
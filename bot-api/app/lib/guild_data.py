@@ -0,0 +1,244 @@
+"""
+Loading of guild data and binds.
+
+Reads go through a per-worker cache, invalidated over Redis pubsub, and a request-scoped
+loader, so that every stage of a request shares one read.
+"""
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+
+from redis import exceptions as redis_exceptions
+from bloxlink_lib import GuildData, get_binds
+from bloxlink_lib.database import fetch_guild_data, redis
+from ..config import CONFIG
+from .cache import TTLCache
+from .bind_plan import BindPlan
+from .role_index import RoleIndex
+
+
+__all__ = (
+    "GuildDataLoader",
+    "current_loader",
+    "expect_guild_data",
+    "load_guild_data",
+    "load_bind_plan",
+    "fetch_cached_guild_data",
+    "fetch_cached_bind_plan",
+    "invalidate_guild",
+    "listen_for_invalidations",
+    "INVALIDATION_CHANNEL",
+)
+
+# Services writing guild settings or binds publish the guild ID here, and every worker drops its cached copy.
+INVALIDATION_CHANNEL = "GUILD_CACHE_INVALIDATION"
+
+# the guild data, its fields that were read, and when the first of them was read (time.monotonic())
+GUILD_DATA_CACHE: TTLCache[int, tuple[GuildData, frozenset[str], float]] = TTLCache(
+    "guild_data", CONFIG.GUILD_CACHE_SIZE, CONFIG.GUILD_CACHE_TTL
+)
+BINDS_CACHE: TTLCache[tuple[int, int], BindPlan] = TTLCache(
+    "binds", CONFIG.GUILD_CACHE_SIZE, CONFIG.GUILD_CACHE_TTL
+)
+
+current_loader: ContextVar["GuildDataLoader | None"] = ContextVar("current_loader", default=None)
+
+# bumped on every invalidation, so that reads which raced with one are not cached
+_invalidations = 0
+
+
+def _count_read():
+    if loader := current_loader.get():
+        loader.reads += 1
+
+
+async def fetch_cached_guild_data(guild_id: int, *fields: str) -> GuildData:
+    """fetch_guild_data() behind the worker cache. Only fields that are not cached yet are read."""
+
+    if not fields:
+        return await fetch_guild_data(guild_id)
+
+    cached_guild_data, cached_fields, cached_at = GUILD_DATA_CACHE.get(guild_id, (None, frozenset(), None))
+    missing_fields = set(fields) - cached_fields
+
+    if cached_guild_data and not missing_fields:
+        return cached_guild_data
+
+    invalidations = _invalidations
+    read_at = time.monotonic()
+    guild_data = await fetch_guild_data(guild_id, *missing_fields)
+    _count_read()
+
+    if cached_guild_data:
+        guild_data = cached_guild_data.model_copy(
+            update={field: getattr(guild_data, field) for field in missing_fields}
+        )
+
+    if invalidations == _invalidations:
+        if cached_guild_data:
+            # merged fields expire with the oldest of them, so no field is served longer than GUILD_CACHE_TTL
+            GUILD_DATA_CACHE.set(
+                guild_id,
+                (guild_data, cached_fields | missing_fields, cached_at),
+                ttl=max(cached_at + CONFIG.GUILD_CACHE_TTL - time.monotonic(), 0),
+            )
+        else:
+            GUILD_DATA_CACHE.set(guild_id, (guild_data, frozenset(missing_fields), read_at))
+
+    return guild_data
+
+
+async def fetch_cached_bind_plan(guild_id: int, role_index: RoleIndex) -> BindPlan:
+    """get_binds() behind the worker cache, compiled into a BindPlan once per version of the binds.
+
+    get_binds() resolves legacy verified/unverified roles by name, so the guild's role names are part of the key.
+    """
+
+    key = (guild_id, role_index.names_key)
+    plan = BINDS_CACHE.get(key)
+
+    if plan is None:
+        invalidations = _invalidations
+        plan = BindPlan(await get_binds(guild_id, guild_roles=role_index.roles))
+        _count_read()
+
+        if invalidations == _invalidations:
+            BINDS_CACHE.set(key, plan)
+
+    return plan
+
+
+def invalidate_guild_locally(guild_id: int):
+    """Drop the cached settings and binds of the guild from this worker."""
+
+    global _invalidations  # pylint: disable=global-statement
+    _invalidations += 1
+
+    GUILD_DATA_CACHE.pop(guild_id)
+    BINDS_CACHE.invalidate_where(lambda key: key[0] == guild_id)
+
+
+async def invalidate_guild(guild_id: int):
+    """Tell every worker, including this one, to drop the cached settings and binds of the guild."""
+
+    invalidate_guild_locally(guild_id)
+    await redis.publish(INVALIDATION_CHANNEL, str(guild_id))
+
+
+async def listen_for_invalidations():
+    """Subscribe to the invalidation channel for the lifetime of the worker."""
+
+    global _invalidations  # pylint: disable=global-statement
+
+    pubsub = redis.pubsub()
+
+    while True:
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+                if message and message["type"] == "message":
+                    invalidate_guild_locally(int(message["data"]))
+
+        except redis_exceptions.ConnectionError as e:
+            # invalidations may have been missed while disconnected
+            logging.error(f"Guild cache invalidation listener lost its Redis connection: {e}")
+            _invalidations += 1
+            GUILD_DATA_CACHE.clear()
+            BINDS_CACHE.clear()
+            await asyncio.sleep(5)
+
+
+class GuildDataLoader:
+    """Collects the guild data fields every stage of a request needs and reads them together.
+
+    Endpoints declare up front which fields their stages use with expect(). The first load()
+    for a guild then issues one projected fetch_guild_data() for all of them, and every later
+    load() for those fields is served from the shared result. Concurrent loads for the same
+    guild wait for the read in flight instead of starting their own. A field that was not
+    expected costs one more read for just the missing fields.
+    """
+
+    def __init__(self):
+        self.reads = 0 # database reads, cache hits excluded
+
+        self._expected: set[str] = set()
+        self._guild_data: dict[int, GuildData] = {}
+        self._loaded_fields: dict[int, set[str]] = {}
+        self._bind_plans: dict[int, asyncio.Task[BindPlan]] = {}
+        self._in_flight: dict[int, asyncio.Future] = {}
+
+    def expect(self, *fields: str):
+        """Declare fields that will be needed later in this request."""
+
+        self._expected.update(fields)
+
+    async def load(self, guild_id: int, *fields: str) -> GuildData:
+        """Load the guild data, reading from the database only if a field was not loaded yet."""
+
+        self._expected.update(fields)
+
+        while in_flight := self._in_flight.get(guild_id):
+            await in_flight
+
+        loaded_fields = self._loaded_fields.setdefault(guild_id, set())
+
+        if guild_id in self._guild_data and loaded_fields.issuperset(fields):
+            return self._guild_data[guild_id]
+
+        missing_fields = self._expected - loaded_fields
+        self._in_flight[guild_id] = asyncio.get_running_loop().create_future()
+
+        try:
+            guild_data = await fetch_cached_guild_data(guild_id, *missing_fields)
+
+            if existing := self._guild_data.get(guild_id):
+                guild_data = existing.model_copy(
+                    update={field: getattr(guild_data, field) for field in missing_fields}
+                )
+
+            self._guild_data[guild_id] = guild_data
+
+            loaded_fields.update(missing_fields)
+
+        finally:
+            self._in_flight.pop(guild_id).set_result(None)
+
+        return self._guild_data[guild_id]
+
+    async def load_bind_plan(self, guild_id: int, role_index: RoleIndex) -> BindPlan:
+        """Load the bind plan of the guild once per request."""
+
+        if guild_id not in self._bind_plans:
+            self._bind_plans[guild_id] = asyncio.create_task(fetch_cached_bind_plan(guild_id, role_index))
+
+        return await self._bind_plans[guild_id]
+
+
+def expect_guild_data(*fields: str):
+    """Declare fields for the current request's loader. Does nothing outside of a request."""
+
+    if loader := current_loader.get():
+        loader.expect(*fields)
+
+
+async def load_guild_data(guild_id: int, *fields: str) -> GuildData:
+    """Load guild data through the current request's loader, or directly outside of a request."""
+
+    if loader := current_loader.get():
+        return await loader.load(guild_id, *fields)
+
+    return await fetch_cached_guild_data(guild_id, *fields)
+
+
+async def load_bind_plan(guild_id: int, role_index: RoleIndex) -> BindPlan:
+    """Load the bind plan through the current request's loader, or directly outside of a request."""
+
+    if loader := current_loader.get():
+        return await loader.load_bind_plan(guild_id, role_index)
+
+    return await fetch_cached_bind_plan(guild_id, role_index)
@@ -0,0 +1,93 @@
+"""
+Content-addressed snapshots of guild roles.
+
+A bind request sends the full guild_roles once, and after that only the hash returned for them.
+Snapshots are validated and indexed once, then kept in the worker cache and in Redis for every worker.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+
+from pydantic import TypeAdapter
+from bloxlink_lib import RoleSerializable
+from bloxlink_lib.database import redis
+from ..config import CONFIG
+from .cache import TTLCache
+from .role_index import RoleIndex
+
+
+__all__ = ("hash_guild_roles", "store_guild_roles", "fetch_guild_roles", "resolve_guild_roles")
+
+GUILD_ROLES_CACHE: TTLCache[tuple[int, str], RoleIndex] = TTLCache(
+    "guild_roles", CONFIG.GUILD_ROLES_CACHE_SIZE, CONFIG.GUILD_ROLES_CACHE_TTL
+)
+
+_guild_roles_adapter = TypeAdapter(dict[int, RoleSerializable])
+
+
+def _redis_key(guild_id: int, roles_hash: str) -> str:
+    return f"guild_roles:{guild_id}:{roles_hash}"
+
+
+def _serialize(guild_roles: dict[int, RoleSerializable]) -> str:
+    return json.dumps(
+        {str(role_id): role.model_dump(mode="json") for role_id, role in guild_roles.items()},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+
+def hash_guild_roles(guild_roles: dict[int, RoleSerializable]) -> str:
+    """The hash of the roles, identical for identical roles regardless of their order."""
+
+    return hashlib.sha256(_serialize(guild_roles).encode()).hexdigest()
+
+
+async def store_guild_roles(guild_id: int, guild_roles: dict[int, RoleSerializable]) -> RoleIndex:
+    """Index uploaded roles and store them under their hash, unless they are already stored."""
+
+    payload = _serialize(guild_roles)
+    roles_hash = hashlib.sha256(payload.encode()).hexdigest()
+    role_index = GUILD_ROLES_CACHE.get((guild_id, roles_hash))
+
+    if role_index is None:
+        role_index = RoleIndex(guild_roles, roles_hash)
+        GUILD_ROLES_CACHE.set((guild_id, roles_hash), role_index)
+
+        await redis.set(_redis_key(guild_id, roles_hash), payload, expire=timedelta(seconds=CONFIG.GUILD_ROLES_REDIS_TTL))
+
+    return role_index
+
+
+async def fetch_guild_roles(guild_id: int, roles_hash: str) -> RoleIndex | None:
+    """The roles stored under the hash, or None if they expired or were never uploaded."""
+
+    role_index = GUILD_ROLES_CACHE.get((guild_id, roles_hash))
+
+    if role_index is None:
+        payload = await redis.get(_redis_key(guild_id, roles_hash))
+
+        if payload is None:
+            return None
+
+        role_index = RoleIndex(_guild_roles_adapter.validate_json(payload), roles_hash)
+        GUILD_ROLES_CACHE.set((guild_id, roles_hash), role_index)
+
+    return role_index
+
+
+async def resolve_guild_roles(
+    guild_id: int,
+    guild_roles: dict[int, RoleSerializable] | None,
+    roles_hash: str | None,
+) -> RoleIndex | None:
+    """The roles of a request: stored if they were uploaded, otherwise looked up by their hash."""
+
+    if guild_roles is not None:
+        return await store_guild_roles(guild_id, guild_roles)
+
+    if roles_hash:
+        return await fetch_guild_roles(guild_id, roles_hash)
+
+    return None
@@ -0,0 +1,232 @@
+"""
+Lookups for the alt account and ban evasion restrictions.
+
+The Discord accounts linked to a Roblox account are cached per worker and in Redis. Services
+linking or unlinking accounts publish the Roblox ID to LINKED_ACCOUNTS_INVALIDATION.
+
+The bans of a guild are kept as a Redis set, loaded from Discord once and then updated by the
+relay server's ban events, so checking accounts against it costs one Redis call. While a set is
+loading, the relay server also records the events in a journal, which is replayed onto the
+loaded set as it is put in place.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from datetime import timedelta
+
+from redis import exceptions as redis_exceptions
+from bloxlink_lib import RobloxUser, reverse_lookup, fetch
+from bloxlink_lib.database import redis
+from ..config import CONFIG
+from .cache import TTLCache
+
+
+__all__ = (
+    "fetch_linked_accounts",
+    "find_banned",
+    "invalidate_linked_accounts",
+    "listen_for_linked_account_invalidations",
+    "LINKED_ACCOUNTS_INVALIDATION",
+    "BANS_LOADED_MARKER",
+)
+
+LINKED_ACCOUNTS_INVALIDATION = "LINKED_ACCOUNTS_INVALIDATION"
+
+# member of every loaded ban set, so that a set exists even for guilds without bans
+BANS_LOADED_MARKER = "0"
+
+DISCORD_API = "https://discord.com/api/v10"
+BANS_PAGE_SIZE = 1000
+BANS_LOAD_TIMEOUT = timedelta(minutes=10)
+
+# replays the journal of ban events onto the loaded bans and puts them in place, atomically so
+# that the relay server's events go either to the journal or to the set in place
+FINISH_BANS_LOAD = """
+local events = redis.call("LRANGE", KEYS[4], 0, -1)
+
+for i = 1, #events, 2 do
+    redis.call(events[i], KEYS[1], events[i + 1])
+end
+
+redis.call("RENAME", KEYS[1], KEYS[2])
+redis.call("EXPIRE", KEYS[2], ARGV[1])
+redis.call("DEL", KEYS[3], KEYS[4])
+"""
+
+LINKED_ACCOUNTS_CACHE: TTLCache[int, tuple[int, ...]] = TTLCache(
+    "linked_accounts", CONFIG.GUILD_CACHE_SIZE, CONFIG.LINKED_ACCOUNTS_TTL
+)
+
+# guilds whose bans recently failed to load, so their checks fail fast instead of loading again
+BANS_LOAD_FAILURES: TTLCache[int, bool] = TTLCache(
+    "guild_bans_load_failures", CONFIG.GUILD_CACHE_SIZE, CONFIG.GUILD_BANS_RETRY_AFTER
+)
+
+_loading_bans: dict[int, asyncio.Task] = {}
+_finish_bans_load = redis.register_script(FINISH_BANS_LOAD)
+
+
+def _linked_accounts_key(roblox_id: int) -> str:
+    return f"linked_accounts:{roblox_id}"
+
+
+def _bans_key(guild_id: int) -> str:
+    return f"guild_bans:{guild_id}"
+
+
+def _bans_loading_key(guild_id: int) -> str:
+    """Exists while a worker loads the bans of the guild. The relay server journals ban events while it does."""
+
+    return f"guild_bans:{guild_id}:loading"
+
+
+def _bans_journal_key(guild_id: int) -> str:
+    """Ban events during a load, as pairs of SADD or SREM and the user ID."""
+
+    return f"guild_bans:{guild_id}:journal"
+
+
+async def fetch_linked_accounts(roblox_user: RobloxUser) -> tuple[int, ...]:
+    """The IDs of every Discord account linked to the Roblox account."""
+
+    discord_ids = LINKED_ACCOUNTS_CACHE.get(roblox_user.id)
+
+    if discord_ids is not None:
+        return discord_ids
+
+    key = _linked_accounts_key(roblox_user.id)
+    cached = await redis.get(key)
+
+    if cached is not None:
+        discord_ids = tuple(json.loads(cached))
+    else:
+        discord_ids = tuple(int(discord_id) for discord_id in await reverse_lookup(roblox_user))
+        await redis.set(key, json.dumps(discord_ids), expire=timedelta(seconds=CONFIG.LINKED_ACCOUNTS_TTL))
+
+    LINKED_ACCOUNTS_CACHE.set(roblox_user.id, discord_ids)
+
+    return discord_ids
+
+
+async def invalidate_linked_accounts(roblox_id: int):
+    """Tell every worker that the accounts linked to the Roblox account changed."""
+
+    LINKED_ACCOUNTS_CACHE.pop(roblox_id)
+    await redis.delete(_linked_accounts_key(roblox_id))
+    await redis.publish(LINKED_ACCOUNTS_INVALIDATION, str(roblox_id))
+
+
+async def listen_for_linked_account_invalidations():
+    """Subscribe to the invalidation channel for the lifetime of the worker."""
+
+    pubsub = redis.pubsub()
+
+    while True:
+        try:
+            await pubsub.subscribe(LINKED_ACCOUNTS_INVALIDATION)
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+                if message and message["type"] == "message":
+                    LINKED_ACCOUNTS_CACHE.pop(int(message["data"]))
+
+        except redis_exceptions.ConnectionError as e:
+            logging.error(f"Linked account invalidation listener lost its Redis connection: {e}")
+            LINKED_ACCOUNTS_CACHE.clear()
+            await asyncio.sleep(5)
+
+
+async def _wait_for_other_load(guild_id: int):
+    """Wait for another worker's load of the bans of the guild."""
+
+    while await redis.exists(_bans_loading_key(guild_id)):
+        await asyncio.sleep(0.5)
+
+    if not await redis.exists(_bans_key(guild_id)):
+        raise RuntimeError(f"Another worker failed to load the bans of guild {guild_id}")
+
+
+async def _load_bans(guild_id: int):
+    """Load every ban of the guild from Discord into its Redis set.
+
+    The bans are collected under a temporary key and renamed into place, so other workers never
+    see a partial set. One worker loads a guild at a time, and the others wait for it.
+    """
+
+    key = _bans_key(guild_id)
+    partial_key = f"{key}:partial:{uuid.uuid4().hex}"
+    loading_key = _bans_loading_key(guild_id)
+    journal_key = _bans_journal_key(guild_id)
+    after = 0
+
+    if not await redis.set(loading_key, "1", nx=True, expire=BANS_LOAD_TIMEOUT):
+        await _wait_for_other_load(guild_id)
+        return
+
+    try:
+        await redis.delete(journal_key)
+        await redis.sadd(partial_key, BANS_LOADED_MARKER)
+        await redis.expire(partial_key, BANS_LOAD_TIMEOUT)
+
+        while True:
+            bans, response = await fetch(
+                "GET",
+                f"{DISCORD_API}/guilds/{guild_id}/bans?limit={BANS_PAGE_SIZE}&after={after}",
+                headers={"Authorization": f"Bot {CONFIG.DISCORD_TOKEN}"},
+                parse_as="JSON",
+                raise_on_failure=False,
+            )
+
+            if response.status != 200:
+                raise RuntimeError(f"Fetching the bans of guild {guild_id} failed with status {response.status}")
+
+            if bans:
+                await redis.sadd(partial_key, *(ban["user"]["id"] for ban in bans))
+                after = bans[-1]["user"]["id"]
+
+            if len(bans) < BANS_PAGE_SIZE:
+                break
+
+        await _finish_bans_load(
+            keys=[partial_key, key, loading_key, journal_key],
+            args=[CONFIG.GUILD_BANS_TTL],
+        )
+    except BaseException:
+        await redis.delete(partial_key, loading_key, journal_key)
+        raise
+
+
+def _loaded_bans(guild_id: int, task: asyncio.Task):
+    _loading_bans.pop(guild_id, None)
+
+    if not task.cancelled() and task.exception():
+        logging.warning(f"Loading the bans of guild {guild_id} failed: {task.exception()!r}")
+        BANS_LOAD_FAILURES.set(guild_id, True)
+
+
+async def find_banned(guild_id: int, discord_ids: tuple[int, ...]) -> list[int]:
+    """The accounts that are banned from the guild. Loads the bans of the guild on first use."""
+
+    if not discord_ids:
+        return []
+
+    key = _bans_key(guild_id)
+    found = await redis.smismember(key, [BANS_LOADED_MARKER, *discord_ids])
+
+    if not found[0]:
+        if BANS_LOAD_FAILURES.get(guild_id):
+            raise RuntimeError(f"Loading the bans of guild {guild_id} failed recently")
+
+        if guild_id not in _loading_bans:
+            _loading_bans[guild_id] = asyncio.create_task(_load_bans(guild_id))
+            _loading_bans[guild_id].add_done_callback(lambda task: _loaded_bans(guild_id, task))
+
+        # shielded, so a caller timing out does not cancel the load for everyone else
+        await asyncio.shield(_loading_bans[guild_id])
+
+        found = await redis.smismember(key, [BANS_LOADED_MARKER, *discord_ids])
+
+    return [discord_id for discord_id, banned in zip(discord_ids, found[1:]) if banned]
@@ -0,0 +1,171 @@
+"""
+Nickname templates compiled once, instead of interpreted on every bind calculation.
+"""
+
+import logging
+import random
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+from bloxlink_lib import RobloxUser, MemberSerializable, parse_template
+from ..config import CONFIG
+from .cache import TTLCache
+
+
+__all__ = ("CompiledTemplate", "compile_template", "render_nickname")
+
+PLACEHOLDER_REGEX = re.compile(r"\{([^{}]+)\}")
+NICKNAME_LIMIT = 32 # the longest nickname Discord accepts
+
+
+@dataclass(slots=True, frozen=True)
+class TemplateContext:
+    guild_name: str
+    member: MemberSerializable
+    roblox_user: RobloxUser | None
+
+
+def _smart_name(context: TemplateContext) -> str | None:
+    """The display name with the username, or only the username if they are the same or it is too long."""
+
+    roblox_user = context.roblox_user
+
+    if roblox_user.display_name is None:
+        return None
+
+    if roblox_user.display_name == roblox_user.username:
+        return roblox_user.username
+
+    smart_name = f"{roblox_user.display_name} (@{roblox_user.username})"
+
+    return smart_name if len(smart_name) <= NICKNAME_LIMIT else roblox_user.username
+
+
+# placeholder -> (what it needs, how to render it). Renderers return None for values the user does not have.
+PLACEHOLDERS: dict[str, tuple[str, Callable[[TemplateContext], str | None]]] = {
+    "smart-name": ("roblox_user", _smart_name),
+    "roblox-name": ("roblox_user", lambda context: context.roblox_user.username),
+    "roblox-id": ("roblox_user", lambda context: str(context.roblox_user.id)),
+    "display-name": ("roblox_user", lambda context: context.roblox_user.display_name),
+    "roblox-display-name": ("roblox_user", lambda context: context.roblox_user.display_name),
+    "discord-name": ("member", lambda context: context.member.username),
+    "discord-id": ("member", lambda context: str(context.member.id)),
+    "server-name": ("guild", lambda context: context.guild_name),
+}
+
+
+class CompiledTemplate:
+    """A nickname template split into literal text and placeholders.
+
+    What each placeholder needs is known once the template is compiled. Templates with
+    placeholders that are not compiled (group ranks, account age, disable-nicknaming, ...)
+    are rendered with parse_template() instead.
+    """
+
+    __slots__ = ("template", "parts", "needs", "interpreted")
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parts: list[str | Callable[[TemplateContext], str | None]] = []
+        self.needs: frozenset[str] = frozenset()
+        self.interpreted = False
+
+        needs: set[str] = set()
+        position = 0
+
+        for match in PLACEHOLDER_REGEX.finditer(template):
+            placeholder = PLACEHOLDERS.get(match.group(1))
+
+            if placeholder is None:
+                self.interpreted = True
+                self.parts = []
+                return
+
+            if match.start() > position:
+                self.parts.append(template[position:match.start()])
+
+            needs.add(placeholder[0])
+            self.parts.append(placeholder[1])
+            position = match.end()
+
+        if position < len(template):
+            self.parts.append(template[position:])
+
+        self.needs = frozenset(needs)
+
+    def render(self, context: TemplateContext) -> str | None:
+        """The nickname trimmed to NICKNAME_LIMIT, like parse_template(). None if a placeholder has no value."""
+
+        rendered: list[str] = []
+
+        for part in self.parts:
+            value = part if isinstance(part, str) else part(context)
+
+            if value is None:
+                return None
+
+            rendered.append(value)
+
+        return "".join(rendered)[:NICKNAME_LIMIT]
+
+
+# keyed by the template itself, so changing a guild's template compiles the new one
+TEMPLATE_CACHE: TTLCache[str, CompiledTemplate] = TTLCache(
+    "nickname_templates", CONFIG.NICKNAME_TEMPLATE_CACHE_SIZE, CONFIG.GUILD_CACHE_TTL
+)
+
+
+def compile_template(template: str) -> CompiledTemplate:
+    """Compile the template, or get it from the worker cache."""
+
+    compiled = TEMPLATE_CACHE.get(template)
+
+    if compiled is None:
+        compiled = CompiledTemplate(template)
+        TEMPLATE_CACHE.set(template, compiled)
+
+    return compiled
+
+
+async def render_nickname(
+    guild_id: int,
+    guild_name: str,
+    template: str | None,
+    member: MemberSerializable,
+    roblox_user: RobloxUser | None,
+) -> str | None:
+    """Render the nickname template for the member, like parse_template()."""
+
+    compiled = compile_template(template) if template else None
+    nickname = None
+
+    if compiled is not None and not compiled.interpreted and ("roblox_user" not in compiled.needs or roblox_user):
+        nickname = compiled.render(TemplateContext(guild_name=guild_name, member=member, roblox_user=roblox_user))
+
+    if nickname is None:
+        return await parse_template(
+            guild_id=guild_id,
+            guild_name=guild_name,
+            template=template,
+            member=member,
+            roblox_user=roblox_user
+        )
+
+    if CONFIG.NICKNAME_TEMPLATE_SHADOW_RATE and random.random() < CONFIG.NICKNAME_TEMPLATE_SHADOW_RATE:
+        # the comparison must not fail the request
+        try:
+            interpreted = await parse_template(
+                guild_id=guild_id,
+                guild_name=guild_name,
+                template=template,
+                member=member,
+                roblox_user=roblox_user
+            )
+        except Exception as e: # pylint: disable=broad-except
+            logging.warning(f"Rendering the nickname template of guild {guild_id} with parse_template() failed: {e!r}")
+        else:
+            if interpreted != nickname:
+                logging.error(f"Nickname template mismatch for guild {guild_id}: {template!r} rendered {nickname!r} != {interpreted!r}")
+
+    return nickname
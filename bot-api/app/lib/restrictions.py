@@ -1,13 +1,24 @@
+import asyncio
+import logging
 from typing import Any, Annotated, Literal
 from pydantic import Field
-from bloxlink_lib import RobloxUser, BaseModel
-from bloxlink_lib.database import fetch_guild_data
+from bloxlink_lib import RobloxUser, BaseModel, GuildData
+from ..config import CONFIG
+from .cache import TTLCache
+from .guild_data import load_guild_data
+from .group_lock import GroupLockMatcher, get_group_lock_matcher
+from .linked_accounts import fetch_linked_accounts, find_banned
+
+
+# guild data read by the restriction checks, for GuildDataLoader.expect()
+RESTRICTION_GUILD_DATA_FIELDS = ("ageLimit", "disallowAlts", "disallowBanEvaders", "groupLock")
 
 
 class RestrictedData(BaseModel):
     """Data of the restriction."""
 
     unevaluated: Annotated[list, Field(default_factory=list)]
+    alts: Annotated[list[int], Field(default_factory=list)] # other accounts of the user to remove, with disallowAlts
     is_restricted: bool = False
     reason: str | None = None
     action: str | None = "kick"
@@ -22,16 +33,37 @@ class RestrictedData(BaseModel):
             self.action = "kick"
 
 
+# results of the ageLimit and groupLock checks, keyed by _settings_key()
+RESTRICTION_CACHE: TTLCache[tuple, RestrictedData] = TTLCache(
+    "restrictions", CONFIG.RESTRICTION_CACHE_SIZE, CONFIG.RESTRICTION_CACHE_TTL
+)
+
+
+async def _evaluate_linked_accounts(
+    guild_id: int,
+    user_id: int,
+    roblox_user: RobloxUser,
+    check_ban_evasion: bool,
+) -> tuple[list[int], list[int]]:
+    """The other Discord accounts of the Roblox account, and which of them are banned from the guild."""
+
+    alts = [discord_id for discord_id in await fetch_linked_accounts(roblox_user) if discord_id != user_id]
+    banned = await find_banned(guild_id, tuple(alts)) if check_ban_evasion else []
 
-async def calculate_restrictions(guild_id: int, roblox_user: RobloxUser) -> RestrictedData:
+    return alts, banned
+
+
+async def calculate_restrictions(guild_id: int, roblox_user: RobloxUser, user_id: int | None = None) -> RestrictedData:
     """Check the restrictions in the guild against this roblox_user.
 
-    This does not check for banEvaders or alt accounts. It will, however, include
-    that in the output in the "unevaluated" field.
+    Ban evaders and alt accounts are checked when the Discord user_id is given, within
+    LINKED_ACCOUNTS_TIMEOUT. Otherwise, or if that takes too long, they are included in
+    the "unevaluated" field instead.
 
     #### Args:
         guild_data (GuildData): Settings for the guild.
         roblox_user (RobloxUser): The roblox user data we are checking restrictions against.
+        user_id (int): The Discord account of the user.
 
     #### Returns:
         Restricted: The result from the restriction checks.
@@ -46,32 +78,100 @@ async def calculate_restrictions(guild_id: int, roblox_user: RobloxUser) -> Rest
 
         The reason, action, and source keys are only included if is_restricted is True.
         Unevaluated at this time will only ever contain disallowBanEvaders and disallowAlts.
+        Alts lists the other accounts of the user with disallowAlts, which should be removed from the guild.
     """
 
-    guild_data = await fetch_guild_data(
-        guild_id,
-        "ageLimit",#
-        "disallowAlts",
-        "disallowBanEvaders",#
-        "groupLock", #
-    )
+    guild_data = await load_guild_data(guild_id, *RESTRICTION_GUILD_DATA_FIELDS)
 
     unevaluated: list[Literal["disallowAlts", "disallowBanEvaders"]] = []
+    alts: list[int] = []
+
+    if roblox_user and (guild_data.disallowBanEvaders or guild_data.disallowAlts):
+        linked_accounts = None
+
+        if user_id:
+            try:
+                linked_accounts = await asyncio.wait_for(
+                    _evaluate_linked_accounts(guild_id, user_id, roblox_user, bool(guild_data.disallowBanEvaders)),
+                    CONFIG.LINKED_ACCOUNTS_TIMEOUT,
+                )
+            except Exception as e: # pylint: disable=broad-except
+                logging.error(f"Evaluating the linked accounts of {user_id} in guild {guild_id} failed: {e!r}")
+
+        if linked_accounts is None:
+            if guild_data.disallowBanEvaders:
+                unevaluated.append("disallowBanEvaders")
+
+            if guild_data.disallowAlts:
+                unevaluated.append("disallowAlts")
+        else:
+            linked_alts, banned_alts = linked_accounts
+
+            if guild_data.disallowAlts:
+                alts = linked_alts
+
+            if banned_alts:
+                return RestrictedData(
+                    reason=f"User ({roblox_user.username}) is evading a ban: their account {banned_alts[0]} is banned.",
+                    reason_suffix="this server does not allow ban evasion",
+                    action=guild_data.disallowBanEvaders if guild_data.disallowBanEvaders in ("kick", "ban") else "kick",
+                    source="disallowBanEvaders",
+                    alts=alts,
+                )
+
+    group_lock = get_group_lock_matcher(guild_id, guild_data.groupLock) if guild_data.groupLock else None
+    restrict_data = RESTRICTION_CACHE.get(key := _settings_key(guild_id, guild_data, group_lock, roblox_user))
+
+    if restrict_data is None:
+        restrict_data = _evaluate_settings(guild_data, group_lock, roblox_user)
+        RESTRICTION_CACHE.set(key, restrict_data)
 
-    if roblox_user:
-        if guild_data.disallowBanEvaders:
-            unevaluated.append("disallowBanEvaders")
+    if unevaluated or alts:
+        restrict_data = restrict_data.model_copy(update={"unevaluated": unevaluated, "alts": alts})
 
-        if guild_data.disallowAlts:
-            unevaluated.append("disallowAlts")
+    return restrict_data
+
+
+def _settings_key(
+    guild_id: int,
+    guild_data: GuildData,
+    group_lock: GroupLockMatcher | None,
+    roblox_user: RobloxUser | None,
+) -> tuple:
+    """Everything the ageLimit and groupLock checks depend on.
+
+    That is the version of the settings, and a fingerprint of the user: their name, their
+    ranks in the locked groups and whether their account is old enough.
+    """
+
+    settings_version = (guild_data.ageLimit, group_lock.version if group_lock else None)
+
+    if not roblox_user:
+        return (guild_id, settings_version, None)
+
+    return (
+        guild_id,
+        settings_version,
+        roblox_user.id,
+        roblox_user.username,
+        roblox_user.age_days >= guild_data.ageLimit if guild_data.ageLimit else None,
+        group_lock.ranks_of(roblox_user) if group_lock else None,
+    )
+
+
+def _evaluate_settings(
+    guild_data: GuildData,
+    group_lock: GroupLockMatcher | None,
+    roblox_user: RobloxUser | None,
+) -> RestrictedData:
+    """The ageLimit and groupLock checks. The result only depends on _settings_key()."""
 
     if guild_data.ageLimit:
         if not roblox_user:
             return RestrictedData(
                 reason="User is not verified with Bloxlink",
                 reason_suffix="this server requires you to link a Roblox account to Bloxlink",
-                source="ageLimit",
-                unevaluated=unevaluated
+                source="ageLimit"
             )
 
         if roblox_user.age_days < guild_data.ageLimit:
@@ -80,69 +180,38 @@ async def calculate_restrictions(guild_id: int, roblox_user: RobloxUser) -> Rest
                 reason=f"User's account ({roblox_user.username}) age is less than" \
                     f"{guild_data.ageLimit} days old.",
                 reason_suffix="this server requires users to have a Roblox account created after a certain date",
-                source="ageLimit",
-                unevaluated=unevaluated
+                source="ageLimit"
             )
 
-    if guild_data.groupLock:
+    if group_lock:
         if not roblox_user:
-            kick_unverified = any(
-                g.unverifiedAction == "kick" for g in guild_data.groupLock.values()
-            )
-
             return RestrictedData(
                 reason="User is not verified with Bloxlink.",
                 reason_suffix="this server requires you to link a Roblox account to Bloxlink",
-                action="kick" if kick_unverified else None,
-                source="groupLock",
-                unevaluated=unevaluated
+                action="kick" if group_lock.kick_unverified else None,
+                source="groupLock"
             )
 
-        for group_id, group_lock in guild_data.groupLock.items():
-            group_lock_action = group_lock.verifiedAction
-            required_rolesets = group_lock.roleSets
-            dm_message = group_lock.dmMessage or ""
-
-            if dm_message:
-                dm_message = f"\n\n**The following text is from the server admins:**" \
-                    f"\n>{dm_message} "
-
-            group_match = roblox_user.groups.get(int(group_id)) # TODO: don't cast to int
+        if failure := group_lock.first_failure(roblox_user):
+            group, in_group = failure
 
-            if not group_match:
+            if not in_group:
                 return RestrictedData(
                     reason=f"User ({roblox_user.username}) is not in the group " \
-                        f"{group_id}{dm_message}",
-                    reason_suffix=f"this server requires users to be in [{group_lock.groupName}](<https://www.roblox.com/groups/{group_id}>)",
-                    action=group_lock_action,
-                    source="groupLock",
-                    unevaluated=unevaluated
+                        f"{group.group_id}{group.dm_message}",
+                    reason_suffix=group.not_in_group_suffix,
+                    action=group.action,
+                    source="groupLock"
                 )
 
-            user_roleset = group_match.role.rank
-
-            if required_rolesets:
-                for roleset in required_rolesets:
-                    if isinstance(roleset, list):
-                        # within range
-                        if roleset[0] <= user_roleset <= roleset[1]:
-                            break
-                    else:
-                        # exact match (x) or inverse match (rolesets above x)
-                        if (user_roleset == roleset) or (roleset < 0 and abs(roleset) <= user_roleset):
-                            break
-                else:
-                    # no match was found - restrict the user.
-                    # fmt:skip
-                    return RestrictedData(
-                        reason=f"User ({roblox_user.username}) does not have the required rank in the group " \
-                            f"{group_id}.{dm_message}",
-                        reason_suffix=f"this server requires users have rank **{roleset} or higher** in [{group_lock.groupName}](<https://www.roblox.com/groups/{group_id}>)",
-                        action=group_lock_action,
-                        source="groupLock",
-                        unevaluated=unevaluated
-                    )
-
-    return RestrictedData(
-        unevaluated=unevaluated
-    )
+            # no required rank matched - restrict the user.
+            # fmt:skip
+            return RestrictedData(
+                reason=f"User ({roblox_user.username}) does not have the required rank in the group " \
+                    f"{group.group_id}.{group.dm_message}",
+                reason_suffix=group.rank_suffix,
+                action=group.action,
+                source="groupLock"
+            )
+
+    return RestrictedData()
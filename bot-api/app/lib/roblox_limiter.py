@@ -0,0 +1,325 @@
+"""
+A rate limit on calls to Roblox shared by every bot-api worker.
+
+The calls take tokens from one token bucket in Redis, refilled at ROBLOX_RATE_LIMIT per second
+up to ROBLOX_RATE_BURST. Bulk work only takes a token while more than ROBLOX_RATE_BULK_RESERVE
+are left, so interactive lookups are not crowded out, and within a worker interactive calls
+are let through first. A 429 from Roblox pauses the bucket for every worker for its Retry-After.
+
+Calls wait for a token until the deadline of their request, and fail with RateLimitTimeout after.
+The priority and deadline are set for everything a request does with roblox_budget(). Calls
+shared by several requests run with SHARED_BUDGET, the highest priority and latest deadline of them.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from enum import IntEnum
+from typing import Any, Iterator
+
+from bloxlink_lib import fetch
+from bloxlink_lib.database import redis
+from ..config import CONFIG
+
+
+__all__ = (
+    "Priority",
+    "RateLimitTimeout",
+    "ROBLOX_LIMITER",
+    "SHARED_BUDGET",
+    "roblox_budget",
+    "current_budget",
+    "limited_fetch",
+    "pause_if_rate_limited",
+)
+
+BUCKET_KEY = "roblox_rate_limit"
+
+# returns the seconds to wait for a token, as a string since Lua numbers are truncated, or "0" if one was taken
+TAKE_TOKEN = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate, burst, needed = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+
+local paused_until = tonumber(redis.call("HGET", KEYS[1], "paused_until") or 0)
+
+if paused_until > now then
+    return tostring(paused_until - now)
+end
+
+local tokens = tonumber(redis.call("HGET", KEYS[1], "tokens") or burst)
+local updated_at = tonumber(redis.call("HGET", KEYS[1], "updated_at") or now)
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+
+local wait = 0
+
+if tokens >= needed then
+    tokens = tokens - 1
+else
+    wait = (needed - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("EXPIRE", KEYS[1], 3600)
+
+return tostring(wait)
+"""
+
+PAUSE = """
+local time = redis.call("TIME")
+local until_ = tonumber(time[1]) + tonumber(time[2]) / 1000000 + tonumber(ARGV[1])
+
+if until_ > tonumber(redis.call("HGET", KEYS[1], "paused_until") or 0) then
+    redis.call("HSET", KEYS[1], "paused_until", tostring(until_))
+    redis.call("EXPIRE", KEYS[1], 3600)
+end
+"""
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class RateLimitTimeout(asyncio.TimeoutError):
+    """No token became available before the deadline of the request."""
+
+
+@dataclass(slots=True)
+class Budget:
+    priority: Priority = Priority.INTERACTIVE
+    deadline: float | None = None # in loop.time(), or ROBLOX_RATE_MAX_WAIT from each call without one
+
+    def widen(self, priority: Priority, deadline: float | None):
+        """Give a call shared with another request the higher of both priorities and the later deadline."""
+
+        self.priority = min(self.priority, priority)
+        self.deadline = None if self.deadline is None or deadline is None else max(self.deadline, deadline)
+
+
+_budget: ContextVar[Budget | None] = ContextVar("roblox_budget", default=None)
+
+
+@contextmanager
+def roblox_budget(priority: Priority = Priority.INTERACTIVE, deadline: float | None = None) -> Iterator[None]:
+    """Calls to Roblox made inside, and in tasks created inside, have this priority and wait
+    for a token until the deadline, in loop.time(). Without one they wait ROBLOX_RATE_MAX_WAIT.
+    """
+
+    token = _budget.set(Budget(priority, deadline))
+
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+def current_budget() -> tuple[Priority, float | None]:
+    """The priority and deadline set by roblox_budget() for the current request."""
+
+    budget = _budget.get()
+
+    return (budget.priority, budget.deadline) if budget else (Priority.INTERACTIVE, None)
+
+
+class SharedBudget:
+    """The budget of a call shared by several requests, for SingleFlight.
+
+    The call starts with the budget of the request that started it, and every request that
+    joins it widens it, so it is neither held to the earliest deadline nor left at bulk
+    priority while an interactive request waits for it.
+    """
+
+    def start(self) -> Budget:
+        """Set a budget of its own in the context of a new call."""
+
+        budget = Budget(*current_budget())
+        _budget.set(budget)
+
+        return budget
+
+    def join(self, budget: Budget):
+        budget.widen(*current_budget())
+
+
+SHARED_BUDGET = SharedBudget()
+
+
+@dataclass(slots=True)
+class LimiterStats:
+    granted: int = 0
+    timeouts: int = 0
+    throttled: int = 0 # 429s from Roblox
+    wait_seconds: float = 0.0 # in total, by the calls that were granted a token
+    max_wait_seconds: float = 0.0
+
+
+class RateLimiter:
+    """Hands out tokens from the Redis bucket to the waiting calls of this worker, highest priority first."""
+
+    def __init__(self):
+        self.stats = {priority: LimiterStats() for priority in Priority}
+
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._arrived = asyncio.Event()
+        self._take_token = redis.register_script(TAKE_TOKEN)
+        self._pause = redis.register_script(PAUSE)
+
+    async def acquire(self, deadline: float | None = None):
+        """Wait for a token, with the priority of the current request, until the deadline
+        if given, or else the deadline of the current request.
+        """
+
+        if not CONFIG.ROBLOX_RATE_LIMIT:
+            return
+
+        loop = asyncio.get_running_loop()
+        priority, request_deadline = current_budget()
+        deadline = deadline or request_deadline or loop.time() + CONFIG.ROBLOX_RATE_MAX_WAIT
+        stats = self.stats[priority]
+
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._arrived.set()
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        started_at = loop.time()
+
+        try:
+            await asyncio.wait_for(future, max(deadline - started_at, 0))
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise RateLimitTimeout(f"No Roblox rate limit token became available within {deadline - started_at:.2f}s") from None
+
+        waited = loop.time() - started_at
+        stats.granted += 1
+        stats.wait_seconds += waited
+        stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+    async def pause(self, seconds: float):
+        """Stop every worker from calling Roblox for this long, after a 429."""
+
+        self.stats[current_budget()[0]].throttled += 1
+        await self._pause(keys=[BUCKET_KEY], args=[seconds])
+
+    async def _take(self, priority: Priority) -> float:
+        """Take a token from the bucket, or return how long to wait for one."""
+
+        needed = 1 + (CONFIG.ROBLOX_RATE_BULK_RESERVE if priority == Priority.BULK else 0)
+
+        try:
+            return float(await self._take_token(
+                keys=[BUCKET_KEY],
+                args=[CONFIG.ROBLOX_RATE_LIMIT, CONFIG.ROBLOX_RATE_BURST, needed],
+            ))
+        except Exception as e: # pylint: disable=broad-except
+            # Roblox lookups should not fail because the limiter is unavailable
+            logging.warning(f"Taking a Roblox rate limit token failed, letting the call through: {e!r}")
+            return 0.0
+
+    async def _dispatch(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+
+            if future.done(): # timed out or cancelled
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = await self._take(Priority(priority))
+
+            if wait:
+                # stop waiting early for a call that arrives meanwhile, it may have a higher priority
+                self._arrived.clear()
+
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), min(wait, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            heapq.heappop(self._waiters)
+
+            if not future.done():
+                future.set_result(None)
+
+    def queue_depth(self) -> dict[str, int]:
+        depth = {priority.name.lower(): 0 for priority in Priority}
+
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[Priority(priority).name.lower()] += 1
+
+        return depth
+
+    def metrics(self) -> dict[str, Any]:
+        """Statistics for the metrics endpoint."""
+
+        return {
+            "queue_depth": self.queue_depth(),
+            **{priority.name.lower(): asdict(stats) for priority, stats in self.stats.items()},
+        }
+
+
+ROBLOX_LIMITER = RateLimiter()
+
+
+def _retry_after(headers) -> float:
+    try:
+        return float(headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return CONFIG.ROBLOX_RATE_RETRY_AFTER
+
+
+async def pause_if_rate_limited(error: Exception):
+    """Pause every worker if the error is a 429 raised by a bloxlink_lib fetcher.
+
+    The fetchers do not return their responses, so the status and the Retry-After header are
+    read from the error, or its response, where they are available.
+    """
+
+    response = getattr(error, "response", None)
+    status = getattr(error, "status", None) or getattr(error, "status_code", None) or getattr(response, "status", None)
+
+    if status == 429:
+        await ROBLOX_LIMITER.pause(_retry_after(getattr(response, "headers", None)))
+
+
+async def limited_fetch(method: str, url: str, **kwargs) -> tuple[Any, Any]:
+    """fetch() once a token is available.
+
+    A 429 pauses every worker for its Retry-After, and the call is retried after it, at most
+    ROBLOX_RATE_MAX_ATTEMPTS times and until the deadline of the request, or ROBLOX_RATE_MAX_WAIT
+    without one. After that the 429 is returned. Other failures are returned instead of raised
+    too, so callers check the status of the response.
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = current_budget()[1] or loop.time() + CONFIG.ROBLOX_RATE_MAX_WAIT
+
+    for attempt in range(1, CONFIG.ROBLOX_RATE_MAX_ATTEMPTS + 1):
+        await ROBLOX_LIMITER.acquire(deadline)
+
+        json_response, response = await fetch(method, url, raise_on_failure=False, **kwargs)
+
+        if response.status != 429:
+            break
+
+        retry_after = _retry_after(response.headers)
+        await ROBLOX_LIMITER.pause(retry_after)
+
+        if attempt == CONFIG.ROBLOX_RATE_MAX_ATTEMPTS or loop.time() + retry_after > deadline:
+            break
+
+        # waits even when the limiter is off, which leaves the pause to the bucket
+        await asyncio.sleep(retry_after)
+
+    return json_response, response
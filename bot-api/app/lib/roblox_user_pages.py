@@ -0,0 +1,115 @@
+"""
+Paginated badges and groups of Roblox users, for accounts with too many to return at once.
+
+Pages are keyset-paginated on continuation_id, the ID of the last item read. Roblox paginates
+badges with opaque cursors, so the cursor to continue from after an item is kept in Redis
+for ROBLOX_PAGE_CURSOR_TTL. Only the badge pages needed for the requested page are fetched.
+"""
+
+import json
+from datetime import timedelta
+from typing import Any
+
+from bloxlink_lib.database import redis
+from domain.common import PageOptions, PaginatedSet
+from ..config import CONFIG
+from .roblox_limiter import limited_fetch
+
+
+__all__ = ("fetch_badges_page", "fetch_groups_page")
+
+BADGES_API = "https://badges.roblox.com/v1/users/{roblox_id}/badges"
+GROUPS_API = "https://groups.roblox.com/v2/users/{roblox_id}/groups/roles"
+BADGES_PAGE_SIZE = 100 # the most the badges API returns per page
+
+
+def _cursor_key(roblox_id: int, continuation_id: int) -> str:
+    return f"roblox_badges_cursor:{roblox_id}:{continuation_id}"
+
+
+async def _fetch_badges(roblox_id: int, cursor: str | None) -> tuple[list[dict[str, Any]], str | None]:
+    """One page of badges from Roblox, and the cursor of the page after it."""
+
+    url = f"{BADGES_API.format(roblox_id=roblox_id)}?limit={BADGES_PAGE_SIZE}&sortOrder=Asc"
+
+    if cursor:
+        url += f"&cursor={cursor}"
+
+    json_response, response = await limited_fetch("GET", url, parse_as="JSON")
+
+    if response.status != 200:
+        raise RuntimeError(f"Fetching the badges of Roblox user {roblox_id} failed with status {response.status}")
+
+    return json_response["data"], json_response.get("nextPageCursor")
+
+
+async def fetch_badges_page(roblox_id: int, page_options: PageOptions) -> PaginatedSet[dict[str, Any]] | None:
+    """The badges of the user after page_options.continuation_id, at most page_options.limit of them.
+
+    Returns None if the continuation_id was not handed out for this user, or has expired.
+    The total is not known.
+    """
+
+    cursor, skip = None, 0
+
+    if page_options.continuation_id is not None:
+        saved = await redis.get(_cursor_key(roblox_id, page_options.continuation_id))
+
+        if saved is None:
+            return None
+
+        cursor, skip = json.loads(saved)
+
+    items: list[dict[str, Any]] = []
+    has_more = True
+
+    while len(items) < page_options.limit and has_more:
+        badges, next_cursor = await _fetch_badges(roblox_id, cursor)
+        taken = badges[skip:skip + page_options.limit - len(items)]
+        items.extend(taken)
+
+        if skip + len(taken) < len(badges):
+            # the page continues in the middle of this Roblox page
+            skip += len(taken)
+        else:
+            cursor, skip = next_cursor, 0
+            has_more = next_cursor is not None
+
+    if not (has_more and items):
+        return PaginatedSet(items=items, total=None)
+
+    continuation_id = items[-1]["id"]
+
+    await redis.set(
+        _cursor_key(roblox_id, continuation_id),
+        json.dumps([cursor, skip]),
+        expire=timedelta(seconds=CONFIG.ROBLOX_PAGE_CURSOR_TTL),
+    )
+
+    return PaginatedSet(items=items, total=None, continuation_id=continuation_id)
+
+
+async def fetch_groups_page(roblox_id: int, page_options: PageOptions) -> PaginatedSet[dict[str, Any]]:
+    """The groups of the user with their role, ordered by group ID, after page_options.continuation_id.
+
+    Roblox returns every group of a user at once. There are at most a few hundred, so the
+    page is sliced from them.
+    """
+
+    json_response, response = await limited_fetch("GET", GROUPS_API.format(roblox_id=roblox_id), parse_as="JSON")
+
+    if response.status != 200:
+        raise RuntimeError(f"Fetching the groups of Roblox user {roblox_id} failed with status {response.status}")
+
+    groups = sorted(json_response["data"], key=lambda membership: membership["group"]["id"])
+
+    if page_options.continuation_id is not None:
+        groups = [membership for membership in groups if membership["group"]["id"] > page_options.continuation_id]
+
+    items = groups[:page_options.limit]
+
+    return PaginatedSet(
+        items=items,
+        total=len(json_response["data"]),
+        continuation_id=items[-1]["group"]["id"] if len(groups) > len(items) else None,
+    )
@@ -0,0 +1,334 @@
+"""
+Roblox user data, cached per section in each worker and in Redis.
+
+Every section (base data, avatars, groups, badges) has its own TTL. Once a section is older
+than its TTL it is still served, up to ROBLOX_CACHE_MAX_STALE longer, while it is refreshed
+in the background.
+
+Usernames resolve to IDs through a case-insensitive cache, also in both tiers. Names that do
+not exist are remembered for ROBLOX_USERNAME_MISS_TTL, and names are re-resolved once the
+user's base data shows that they were renamed.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, asdict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+
+import pydantic_core
+from pydantic import TypeAdapter
+from bloxlink_lib import RobloxUser, fetch_roblox_id, fetch_base_data, fetch_user_avatars, fetch_user_groups, fetch_user_badges, create_task_log_exception
+from bloxlink_lib.database import redis
+from ..config import CONFIG
+from .cache import TTLCache
+from .roblox_limiter import ROBLOX_LIMITER, SHARED_BUDGET, Priority, roblox_budget, limited_fetch, pause_if_rate_limited
+from .singleflight import SingleFlight
+
+
+__all__ = ("SECTIONS", "fetch_section", "fetch_section_hedged", "resolve_roblox_id", "fetch_users_bulk", "section_stats")
+
+USERS_BY_NAME_API = "https://users.roblox.com/v1/usernames/users"
+USERS_BY_ID_API = "https://users.roblox.com/v1/users"
+BULK_CHUNK_SIZE = 100 # the most either bulk API accepts per call
+
+
+@dataclass(slots=True)
+class SectionStats:
+    hits: int = 0 # fresh, from either tier
+    stale_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    errors: int = 0
+    hedges: int = 0 # second fetches started by fetch_section_hedged()
+    hedge_wins: int = 0 # ... that finished before the first
+
+
+@dataclass(slots=True)
+class Section:
+    name: str
+    fetcher: Callable[..., Awaitable[dict[str, Any]]]
+    ttl: float
+    cache: TTLCache[tuple, tuple[float, dict[str, Any]]]
+    stats: SectionStats
+
+
+def _section(name: str, fetcher: Callable[..., Awaitable[dict[str, Any]]], ttl: float) -> Section:
+    return Section(
+        name=name,
+        fetcher=fetcher,
+        ttl=ttl,
+        cache=TTLCache(f"roblox_user_{name}", CONFIG.ROBLOX_CACHE_SIZE, ttl + CONFIG.ROBLOX_CACHE_MAX_STALE),
+        stats=SectionStats(),
+    )
+
+
+SECTIONS: dict[str, Section] = {
+    "base": _section("base", fetch_base_data, CONFIG.ROBLOX_BASE_TTL),
+    "avatars": _section("avatars", fetch_user_avatars, CONFIG.ROBLOX_AVATARS_TTL),
+    "groups": _section("groups", fetch_user_groups, CONFIG.ROBLOX_GROUPS_TTL),
+    "badges": _section("badges", fetch_user_badges, CONFIG.ROBLOX_BADGES_TTL),
+}
+
+# lowercase username -> Roblox ID, or NO_ROBLOX_USER if there is no such user
+USERNAME_CACHE: TTLCache[str, int] = TTLCache("roblox_usernames", CONFIG.ROBLOX_CACHE_SIZE, CONFIG.ROBLOX_BASE_TTL)
+NO_ROBLOX_USER = 0
+
+_refreshing: dict[tuple, asyncio.Task] = {}
+
+# concurrent requests for the same user share one upstream call
+_section_flights: SingleFlight[dict[str, Any]] = SingleFlight("roblox_user_sections", SHARED_BUDGET)
+_username_flights: SingleFlight[int | None] = SingleFlight("roblox_usernames", SHARED_BUDGET)
+_field_adapters: dict[str, TypeAdapter] = {}
+
+
+def _redis_key(section: Section, key: tuple) -> str:
+    return f"roblox_user:{section.name}:" + ":".join(str(part) for part in key)
+
+
+def _username_key(username: str) -> str:
+    return f"roblox_username:{username.lower()}"
+
+
+def _decode(payload: str | bytes) -> tuple[float, dict[str, Any]]:
+    """Read a section from Redis, validating every field like the RobloxUser field it is set on."""
+
+    entry = json.loads(payload)
+    data: dict[str, Any] = {}
+
+    for field, value in entry["data"].items():
+        if field not in _field_adapters:
+            _field_adapters[field] = TypeAdapter(RobloxUser.model_fields[field].annotation)
+
+        data[field] = _field_adapters[field].validate_python(value)
+
+    return entry["fetched_at"], data
+
+
+async def _fetch(section: Section, key: tuple) -> dict[str, Any]:
+    """Fetch the section from Roblox and store it in both tiers, once for all concurrent callers."""
+
+    return await _section_flights.do((section.name, key), lambda: _fetch_uncoalesced(section, key))
+
+
+async def _fetch_uncoalesced(section: Section, key: tuple) -> dict[str, Any]:
+    await ROBLOX_LIMITER.acquire()
+
+    try:
+        data = await section.fetcher(*key)
+    except Exception as e:
+        # one token is taken per fetcher, but a 429 on any of its calls pauses everyone
+        await pause_if_rate_limited(e)
+        raise
+    fetched_at = time.time()
+
+    if section.name == "base" and data.get("username"):
+        if _renamed(data["username"], key[0]):
+            # the old name may belong to someone else by now
+            await _forget_username(section.cache.get(key)[1]["username"])
+
+        await _remember_username(data["username"], key[0])
+
+    section.cache.set(key, (fetched_at, data))
+
+    await redis.set(
+        _redis_key(section, key),
+        pydantic_core.to_json({"fetched_at": fetched_at, "data": data}),
+        expire=timedelta(seconds=section.ttl + CONFIG.ROBLOX_CACHE_MAX_STALE),
+    )
+
+    return data
+
+
+async def _refresh(section: Section, key: tuple):
+    section.stats.refreshes += 1
+
+    try:
+        # nobody is waiting for a refresh
+        with roblox_budget(Priority.BULK):
+            await _fetch(section, key)
+    except Exception as e: # pylint: disable=broad-except
+        section.stats.errors += 1
+        logging.warning(f"Refreshing the {section.name} of Roblox user {key[0]} failed: {e!r}")
+
+
+def _refresh_in_background(section: Section, key: tuple):
+    if (section.name, key) in _refreshing:
+        return
+
+    task = create_task_log_exception(_refresh(section, key))
+    _refreshing[(section.name, key)] = task
+    task.add_done_callback(lambda _: _refreshing.pop((section.name, key), None))
+
+
+async def fetch_section(name: str, *key: Any, use_cache: bool = True) -> dict[str, Any]:
+    """The fields of a section of the Roblox user, for the fetcher arguments in key.
+
+    With use_cache=False the section is always fetched, and the result is cached for others.
+    """
+
+    section = SECTIONS[name]
+
+    if not use_cache:
+        section.stats.misses += 1
+        return await _fetch(section, key)
+
+    entry = section.cache.get(key)
+
+    if entry is None and (payload := await redis.get(_redis_key(section, key))) is not None:
+        entry = _decode(payload)
+        section.stats.redis_hits += 1
+        section.cache.set(key, entry, ttl=max(entry[0] + section.ttl + CONFIG.ROBLOX_CACHE_MAX_STALE - time.time(), 0))
+
+    if entry is None:
+        section.stats.misses += 1
+        return await _fetch(section, key)
+
+    fetched_at, data = entry
+
+    if time.time() - fetched_at > section.ttl:
+        section.stats.stale_hits += 1
+        _refresh_in_background(section, key)
+    else:
+        section.stats.hits += 1
+
+    return data
+
+
+async def fetch_section_hedged(name: str, *key: Any, use_cache: bool = True, hedge_after: float) -> dict[str, Any]:
+    """fetch_section(), with a second fetch from Roblox if it has not finished after hedge_after seconds.
+
+    The second fetch does not join the call in flight, so it is not held up by the same slow
+    request. Whichever succeeds first is returned and the other is cancelled.
+    """
+
+    section = SECTIONS[name]
+    first = asyncio.ensure_future(fetch_section(name, *key, use_cache=use_cache))
+
+    done, _ = await asyncio.wait([first], timeout=hedge_after)
+
+    if done:
+        return first.result()
+
+    section.stats.hedges += 1
+    hedge = asyncio.ensure_future(_fetch_uncoalesced(section, key))
+    attempts = {first, hedge}
+
+    try:
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if not task.exception():
+                    if task is hedge:
+                        section.stats.hedge_wins += 1
+
+                    return task.result()
+
+        # both failed
+        return first.result()
+    finally:
+        first.cancel()
+        hedge.cancel()
+
+
+def _username_ttl(roblox_id: int) -> float:
+    return CONFIG.ROBLOX_USERNAME_TTL if roblox_id != NO_ROBLOX_USER else CONFIG.ROBLOX_USERNAME_MISS_TTL
+
+
+def _cache_username_locally(username: str, roblox_id: int):
+    # at most as long as base data, which is what tells this worker about renames
+    USERNAME_CACHE.set(username.lower(), roblox_id, ttl=min(_username_ttl(roblox_id), CONFIG.ROBLOX_BASE_TTL))
+
+
+async def _remember_username(username: str, roblox_id: int | None):
+    roblox_id = roblox_id or NO_ROBLOX_USER
+
+    _cache_username_locally(username, roblox_id)
+    await redis.set(_username_key(username), str(roblox_id), expire=timedelta(seconds=_username_ttl(roblox_id)))
+
+
+async def _forget_username(username: str):
+    USERNAME_CACHE.pop(username.lower())
+    await redis.delete(_username_key(username))
+
+
+def _renamed(username: str, roblox_id: int) -> bool:
+    """Whether the base data of the user in this worker shows a different name."""
+
+    entry = SECTIONS["base"].cache.get((roblox_id,))
+
+    return bool(entry and entry[1].get("username") and entry[1]["username"].lower() != username.lower())
+
+
+async def _resolve_uncached(username: str) -> int | None:
+    await ROBLOX_LIMITER.acquire()
+
+    try:
+        roblox_id = await fetch_roblox_id(username)
+    except Exception as e:
+        await pause_if_rate_limited(e)
+        raise
+    await _remember_username(username, roblox_id)
+
+    return roblox_id
+
+
+async def resolve_roblox_id(username: str) -> int | None:
+    """The ID of the Roblox user with this name, or None if there is none. Usernames are case-insensitive.
+
+    Cached in both tiers, and fetched once for all concurrent callers otherwise.
+    """
+
+    roblox_id = USERNAME_CACHE.get(username.lower())
+
+    if roblox_id is None and (payload := await redis.get(_username_key(username))) is not None:
+        roblox_id = int(payload)
+        _cache_username_locally(username, roblox_id)
+
+    if roblox_id is not None and roblox_id != NO_ROBLOX_USER and _renamed(username, roblox_id):
+        await _forget_username(username)
+        roblox_id = None
+
+    if roblox_id is None:
+        roblox_id = await _username_flights.do(username.lower(), lambda: _resolve_uncached(username))
+
+    return roblox_id or None
+
+
+async def fetch_users_bulk(*, ids: list[int] | None = None, usernames: list[str] | None = None) -> list[dict[str, Any]]:
+    """Look up at most BULK_CHUNK_SIZE users with one call to Roblox's bulk users APIs.
+
+    Returns the users that exist, each with their id, name and displayName. Users looked
+    up by name also have the requestedUsername they were found by. The names are remembered
+    for resolve_roblox_id(), and so are the names that were not found.
+    """
+
+    if ids:
+        url, body = USERS_BY_ID_API, {"userIds": ids, "excludeBannedUsers": False}
+    else:
+        url, body = USERS_BY_NAME_API, {"usernames": usernames, "excludeBannedUsers": False}
+
+    json_response, response = await limited_fetch("POST", url, body=body, parse_as="JSON")
+
+    if response.status != 200:
+        raise RuntimeError(f"Bulk Roblox user lookup failed with status {response.status}")
+
+    found_users = json_response["data"]
+    found_names = {found["requestedUsername"].lower() for found in found_users if "requestedUsername" in found}
+
+    await asyncio.gather(
+        *(_remember_username(found["name"], found["id"]) for found in found_users),
+        *(_remember_username(username, None) for username in usernames or () if username.lower() not in found_names),
+    )
+
+    return found_users
+
+
+def section_stats() -> dict[str, dict]:
+    """Statistics for the metrics endpoint."""
+
+    return {name: {"ttl": section.ttl, **asdict(section.stats)} for name, section in SECTIONS.items()}
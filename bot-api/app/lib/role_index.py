@@ -0,0 +1,40 @@
+"""
+Lookups over the roles of a guild, built once from the roles sent with a request.
+"""
+
+from typing import Iterable
+
+from bloxlink_lib import RoleSerializable
+
+
+__all__ = ("RoleIndex",)
+
+
+class RoleIndex:
+    """The roles of a guild, indexed by ID and position.
+
+    Role IDs are integers throughout. They only become whatever the response needs when serialized.
+    """
+
+    __slots__ = ("roles", "roles_hash", "positions", "role_ids", "names_key")
+
+    def __init__(self, guild_roles: dict[int, RoleSerializable], roles_hash: str | None = None):
+        self.roles = guild_roles
+        self.roles_hash = roles_hash # set for snapshots stored with store_guild_roles()
+
+        self.positions: dict[int, int] = {int(role_id): role.position for role_id, role in guild_roles.items()}
+        self.role_ids: frozenset[int] = frozenset(self.positions)
+
+        # get_binds() resolves legacy verified/unverified roles by name, so bind plans are cached under
+        # this key. It has every ID with its name, since several roles can share a name.
+        self.names_key = hash(frozenset((int(role_id), role.name) for role_id, role in guild_roles.items()))
+
+    def highest(self, role_ids: Iterable[int]) -> int | None:
+        """The ID of the highest of the roles, ignoring roles the guild does not have."""
+
+        positions = self.positions
+
+        return max((role_id for role_id in role_ids if role_id in positions), key=positions.__getitem__, default=None)
+
+    def __len__(self) -> int:
+        return len(self.positions)
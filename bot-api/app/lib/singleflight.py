@@ -0,0 +1,101 @@
+"""
+Coalescing of identical concurrent calls within a worker.
+"""
+
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Generic, Hashable, Protocol, TypeVar
+
+
+__all__ = ("SingleFlight", "SharedContext", "FLIGHTS")
+
+T = TypeVar("T")
+
+FLIGHTS: dict[str, "SingleFlight"] = {}
+
+
+class SharedContext(Protocol):
+    """Context variables a call shares between its callers."""
+
+    def start(self) -> Any:
+        """Set the variables in the context of a new call, returning what join() updates."""
+
+    def join(self, state: Any):
+        """Update the call's variables for another caller, from the caller's context."""
+
+
+class SingleFlight(Generic[T]):
+    """Runs one call per key at a time. Callers arriving while it runs wait for its result.
+
+    The call runs in its own task, so a caller that is cancelled does not cancel it for the
+    others. Once every caller has left, the call is cancelled, as nobody wants its result. Every instance registers itself in FLIGHTS by name so its statistics can be exposed.
+
+    The task copies the context of the caller that started it. Variables that should reflect
+    every caller instead, like a deadline, are kept up to date by the optional SharedContext.
+    """
+
+    def __init__(self, name: str, shared: SharedContext | None = None):
+        self.name = name
+        self.shared = shared
+
+        self.calls = 0 # calls that ran
+        self.coalesced = 0 # callers that waited for a call in flight instead
+        self.abandoned = 0 # calls cancelled because every caller left
+
+        self._in_flight: dict[Hashable, asyncio.Task[T]] = {}
+        self._waiting: dict[asyncio.Task[T], int] = {} # callers of each call
+        self._shared_state: dict[asyncio.Task[T], Any] = {}
+
+        FLIGHTS[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() for the key, unless a call for the key is in flight already."""
+
+        task = self._in_flight.get(key)
+
+        if task is None:
+            self.calls += 1
+
+            context = contextvars.copy_context()
+            state = context.run(self.shared.start) if self.shared else None
+
+            task = asyncio.get_running_loop().create_task(fn(), context=context)
+            self._in_flight[key] = task
+            self._shared_state[task] = state
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+
+            if self.shared:
+                self.shared.join(self._shared_state[task])
+
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiting[task] -= 1
+
+            if not self._waiting[task]:
+                del self._waiting[task]
+
+                if not task.done():
+                    # callers arriving from now on start a new call
+                    self._forget(key, task)
+                    self.abandoned += 1
+                    task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task[T]):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._shared_state.pop(task, None)
+
+    def stats(self) -> dict:
+        """Statistics for the metrics endpoint."""
+
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
@@ -5,13 +5,16 @@ from blacksheep import Application
 from rodi import Container
 
 from app.auth import configure_authentication
+from app.request_scope import configure_request_scope
 # from app.docs import configure_docs
 from app.errors import configure_error_handlers
 # from app.services import configure_services
 from app.config import CONFIG
 from dotenv import load_dotenv
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
-from bloxlink_lib import get_environment, Environment
+from bloxlink_lib import get_environment, Environment, create_task_log_exception
+from app.lib.guild_data import listen_for_invalidations
+from app.lib.linked_accounts import listen_for_linked_account_invalidations
 
 # def configure_application(
 #     services: Container,
@@ -39,6 +42,13 @@ def configure_application() -> Application:
     app = configure_authentication(Application(
         show_error_details=get_environment() == Environment.LOCAL
     ))
+    app = configure_request_scope(app)
+
+    async def start_cache_invalidation(_: Application):
+        create_task_log_exception(listen_for_invalidations())
+        create_task_log_exception(listen_for_linked_account_invalidations())
+
+    app.on_start += start_cache_invalidation
 
     app = SentryAsgiMiddleware(app)
 
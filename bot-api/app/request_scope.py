@@ -0,0 +1,26 @@
+from typing import Callable, Awaitable
+import logging
+from blacksheep import Application, Request, Response
+from app.lib.guild_data import GuildDataLoader, current_loader
+
+
+def configure_request_scope(app: Application):
+    """Adds a middleware giving every request its own guild data loader"""
+
+    async def request_scope(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
+        loader = GuildDataLoader()
+        token = current_loader.set(loader)
+
+        try:
+            response = await handler(request)
+        finally:
+            current_loader.reset(token)
+
+        logging.debug(f"{request.method} {request.url.path.decode()}: {loader.reads} guild data read(s)")
+        response.add_header(b"X-Guild-Data-Reads", str(loader.reads).encode())
+
+        return response
+
+    app.middlewares.append(request_scope)
+
+    return app
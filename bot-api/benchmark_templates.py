@@ -0,0 +1,67 @@
+"""
+Compares the throughput of compiled nickname templates against parse_template().
+
+    python benchmark_templates.py [--iterations 20000] [--template "{roblox-name} | {server-name}"]
+
+Both paths render the same template for the same member and Roblox user. Templates with
+placeholders that are not compiled are reported as such, since they use parse_template() either way.
+"""
+
+import argparse
+import asyncio
+import time
+
+from bloxlink_lib import RobloxUser, MemberSerializable, parse_template
+from app.lib.nickname_templates import compile_template, TemplateContext
+
+GUILD_ID = 1
+GUILD_NAME = "Benchmark Guild"
+
+
+async def run(iterations: int, template: str):
+    member = MemberSerializable.model_construct(id=84117866944663552, username="discordian", role_ids=set())
+    roblox_user = RobloxUser.model_construct(id=156, username="builderman", display_name="Builderman")
+
+    compiled = compile_template(template)
+
+    if compiled.interpreted:
+        print(f"{template!r} has placeholders that are not compiled, both paths use parse_template()")
+        return
+
+    context = TemplateContext(guild_name=GUILD_NAME, member=member, roblox_user=roblox_user)
+
+    interpreted = await parse_template(guild_id=GUILD_ID, guild_name=GUILD_NAME, template=template, member=member, roblox_user=roblox_user)
+    rendered = compiled.render(context)
+
+    if rendered != interpreted:
+        print(f"warning: compiled {rendered!r} != interpreted {interpreted!r}")
+
+    start = time.perf_counter()
+
+    for _ in range(iterations):
+        await parse_template(guild_id=GUILD_ID, guild_name=GUILD_NAME, template=template, member=member, roblox_user=roblox_user)
+
+    interpreted_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+
+    for _ in range(iterations):
+        compile_template(template).render(context)
+
+    compiled_seconds = time.perf_counter() - start
+
+    print(f"template: {template!r} ({iterations} renders)")
+    print(f"interpreted: {iterations / interpreted_seconds:,.0f}/s")
+    print(f"compiled:    {iterations / compiled_seconds:,.0f}/s ({interpreted_seconds / compiled_seconds:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--template", default="{roblox-name} | {server-name}")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.iterations, args.template))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,8 @@ T = TypeVar("T")
 @dataclass(slots=True)
 class PaginatedSet(Generic[T]):
     items: list[T]
-    total: int
+    total: int | None # None if it is not known without reading every page
+    continuation_id: int | None = None # the continuation_id of the next page, None on the last page
 
     def __iter__(self):
         yield from self.items
@@ -0,0 +1,186 @@
+"""
+The compiled bind plan must give the same result as checking every bind with satisfies_for().
+"""
+
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("bloxlink_lib")
+os.environ.setdefault("BOT_API_AUTH", "test")
+
+from bloxlink_lib import GuildBind, RobloxUser, MemberSerializable, RoleSerializable # noqa: E402
+from app.lib import binds as binds_module # noqa: E402
+from app.lib.bind_plan import BindPlan # noqa: E402
+from app.lib.role_index import RoleIndex # noqa: E402
+
+
+GUILD_ID = 1
+GROUP_IDS = (10, 20, 30)
+RANKS = (0, 1, 2, 50, 99, 100, 101, 200, 254, 255)
+ROLE_IDS = tuple(range(100, 120))
+DELETED_ROLE_ID = 999 # bound, but no longer in the guild
+
+
+def group_bind(group_id: int, roles: list[int], remove_roles: list[int] = (), **group) -> GuildBind:
+    return GuildBind(
+        roles=[str(role_id) for role_id in roles],
+        remove_roles=[str(role_id) for role_id in remove_roles],
+        criteria={"type": "group", "id": group_id, "group": {"dynamicRoles": False, "everyone": False, "guest": False, **group}},
+    )
+
+
+def status_bind(bind_type: str, roles: list[int], remove_roles: list[int] = ()) -> GuildBind:
+    return GuildBind(
+        roles=[str(role_id) for role_id in roles],
+        remove_roles=[str(role_id) for role_id in remove_roles],
+        criteria={"type": bind_type},
+    )
+
+
+def make_binds(rng: random.Random) -> list[GuildBind]:
+    """Every kind of bind the plan compiles, with random roles."""
+
+    def roles() -> list[int]:
+        return rng.sample((*ROLE_IDS, DELETED_ROLE_ID), rng.randint(1, 3))
+
+    def remove_roles() -> list[int]:
+        return rng.sample(ROLE_IDS, rng.randint(0, 2))
+
+    binds = []
+
+    for group_id in GROUP_IDS:
+        low, high = sorted(rng.sample(RANKS, 2))
+
+        binds.extend((
+            group_bind(group_id, roles(), remove_roles(), everyone=True),
+            group_bind(group_id, roles(), remove_roles(), roleset=rng.choice(RANKS[1:])),
+            group_bind(group_id, roles(), remove_roles(), roleset=-rng.choice(RANKS[1:])),
+            group_bind(group_id, roles(), remove_roles(), min=low, max=high),
+            group_bind(group_id, roles(), remove_roles(), min=low),
+            group_bind(group_id, roles(), remove_roles(), max=high),
+            group_bind(group_id, roles(), remove_roles(), guest=True),
+            group_bind(group_id, roles(), remove_roles(), roleset=rng.choice(RANKS[1:]), min=low, max=high),
+            group_bind(group_id, [], dynamicRoles=True),
+        ))
+
+    if rng.random() < 0.7:
+        binds.append(status_bind("verified", roles(), remove_roles()))
+
+    if rng.random() < 0.7:
+        binds.append(status_bind("unverified", roles(), remove_roles()))
+
+    rng.shuffle(binds)
+
+    return binds
+
+
+def make_roblox_user(rng: random.Random) -> RobloxUser | None:
+    if rng.random() < 0.25:
+        return None
+
+    groups = {}
+
+    for group_id in rng.sample(GROUP_IDS, rng.randint(0, len(GROUP_IDS))):
+        rank = rng.choice(RANKS)
+        groups[group_id] = {
+            "id": group_id,
+            "name": f"Group {group_id}",
+            "role": {"id": group_id * 1000 + rank, "name": f"Rank {rank}", "rank": rank},
+        }
+
+    return RobloxUser(id=rng.randint(1, 10**9), username="roblox_user", groups=groups)
+
+
+def make_role_index() -> RoleIndex:
+    return RoleIndex({
+        role_id: RoleSerializable.model_construct(id=role_id, name=f"Role {role_id}", position=position, managed=False)
+        for position, role_id in enumerate(ROLE_IDS)
+    })
+
+
+def make_member(rng: random.Random) -> MemberSerializable:
+    return MemberSerializable.model_construct(
+        id=1,
+        username="member",
+        nickname=None,
+        guild_id=GUILD_ID,
+        is_owner=False,
+        role_ids=rng.sample((*ROLE_IDS, DELETED_ROLE_ID), rng.randint(0, 8)),
+    )
+
+
+async def expected_bind_results(
+    binds: list[GuildBind],
+    roblox_user: RobloxUser | None,
+    member: MemberSerializable,
+    role_index: RoleIndex,
+    guild_data: SimpleNamespace,
+) -> tuple[dict[int, set[int]], set[int], set[str]]:
+    """What checking every bind with satisfies_for() gives: the roles added by each bind that
+    applies, by index, the roles to remove and the roles to create.
+    """
+
+    applied: dict[int, set[int]] = {}
+    remove_roles: set[int] = set()
+    missing_roles: set[str] = set()
+
+    for index, bind in enumerate(binds):
+        if (bind.type == "verified" and not guild_data.verifiedRoleEnabled) or (bind.type == "unverified" and not guild_data.unverifiedRoleEnabled):
+            continue
+
+        applies, additional_roles, bind_missing_roles, ineligible_roles = await bind.satisfies_for(role_index.roles, member, roblox_user)
+        remove_roles.update(int(role_id) for role_id in ineligible_roles)
+
+        if applies:
+            applied[index] = {int(role_id) for role_id in (*bind.roles, *additional_roles)}
+            remove_roles.update(int(role_id) for role_id in bind.remove_roles)
+            missing_roles.update(bind_missing_roles)
+        else:
+            remove_roles.update(int(role_id) for role_id in bind.roles if int(role_id) in member.role_ids)
+
+    if roblox_user and guild_data.verifiedRoleEnabled and not any(bind.type == "verified" for bind in binds):
+        missing_roles.add("Verified")
+    elif not roblox_user and guild_data.unverifiedRoleEnabled and not any(bind.type == "unverified" for bind in binds):
+        missing_roles.add("Unverified")
+
+    # roles deleted from the guild cannot be removed
+    return applied, {role_id for role_id in remove_roles if role_id in role_index.roles}, missing_roles
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_plan_matches_satisfies_for(monkeypatch, seed):
+    rng = random.Random(seed)
+
+    plan = BindPlan(make_binds(rng))
+    role_index = make_role_index()
+    guild_data = SimpleNamespace(verifiedRoleEnabled=rng.random() < 0.8, unverifiedRoleEnabled=rng.random() < 0.8)
+
+    async def load_guild_data(guild_id, *fields):
+        return guild_data
+
+    async def load_bind_plan(guild_id, index):
+        return plan
+
+    monkeypatch.setattr(binds_module, "load_guild_data", load_guild_data)
+    monkeypatch.setattr(binds_module, "load_bind_plan", load_bind_plan)
+    monkeypatch.setattr(binds_module.CONFIG, "BIND_PLAN_SHADOW_RATE", 0.0)
+
+    async def compare():
+        for _ in range(10):
+            roblox_user = make_roblox_user(rng)
+            member = make_member(rng)
+
+            results, remove_roles, missing_roles = await binds_module.filter_binds(GUILD_ID, roblox_user, member, role_index)
+            expected = await expected_bind_results(plan.binds, roblox_user, member, role_index, guild_data)
+
+            # by identity, since two random binds can be equal
+            positions = {id(bind): index for index, bind in enumerate(plan.binds)}
+            applied = {positions[id(result.bind)]: set(result.roles) for result in results}
+
+            assert (applied, remove_roles, missing_roles) == expected
+
+    asyncio.run(compare())
@@ -0,0 +1,48 @@
+"""
+Concurrent lookups of the same Roblox user section must share one call to Roblox.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("bloxlink_lib")
+os.environ.setdefault("BOT_API_AUTH", "test")
+
+from app.lib import roblox_users # noqa: E402
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, expire=None):
+        self.values[key] = value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_concurrent_fetch_section_calls_roblox_once(monkeypatch):
+    calls = []
+
+    async def fetcher(roblox_id):
+        calls.append(roblox_id)
+        await asyncio.sleep(0.05)
+        return {"groups": {}}
+
+    section = roblox_users.SECTIONS["groups"]
+    section.cache.clear()
+
+    monkeypatch.setattr(roblox_users, "redis", MemoryRedis())
+    monkeypatch.setattr(section, "fetcher", fetcher)
+
+    async def run():
+        return await asyncio.gather(*(roblox_users.fetch_section("groups", 1) for _ in range(50)))
+
+    assert asyncio.run(run()) == [{"groups": {}}] * 50
+    assert calls == [1]
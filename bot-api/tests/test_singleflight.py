@@ -0,0 +1,153 @@
+"""
+Concurrent identical calls must share one upstream call.
+"""
+
+import asyncio
+import contextvars
+import os
+
+import pytest
+
+from app.lib.singleflight import SingleFlight
+
+
+class CountingFetcher:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self) -> int:
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return 42
+
+
+def test_concurrent_calls_share_one_call():
+    fetcher = CountingFetcher()
+    flight = SingleFlight("test_concurrent")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", fetcher) for _ in range(50)))
+
+    assert asyncio.run(run()) == [42] * 50
+    assert fetcher.calls == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 49, "abandoned": 0}
+
+
+def test_different_keys_do_not_share():
+    fetcher = CountingFetcher()
+    flight = SingleFlight("test_keys")
+
+    async def run():
+        return await asyncio.gather(flight.do("a", fetcher), flight.do("b", fetcher))
+
+    assert asyncio.run(run()) == [42, 42]
+    assert fetcher.calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    fetcher = CountingFetcher()
+    flight = SingleFlight("test_cancelled")
+
+    async def run():
+        first = asyncio.create_task(flight.do("key", fetcher))
+        second = asyncio.create_task(flight.do("key", fetcher))
+
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == (42, True)
+    assert fetcher.calls == 1
+
+
+def test_call_is_cancelled_when_every_waiter_leaves():
+    started = []
+    finished = []
+
+    async def fetcher():
+        started.append(True)
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    flight = SingleFlight("test_abandoned")
+
+    async def run():
+        waiters = [asyncio.create_task(flight.do("key", fetcher)) for _ in range(3)]
+
+        await asyncio.sleep(0.01)
+
+        for waiter in waiters:
+            waiter.cancel()
+
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+
+    assert started == [True] and finished == []
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 2, "abandoned": 1}
+
+
+class Budget:
+    """A SharedContext keeping the latest deadline of the callers."""
+
+    deadline: contextvars.ContextVar[float] = contextvars.ContextVar("deadline", default=0.0)
+
+    def start(self) -> list[float]:
+        state = [self.deadline.get()]
+        self.deadline.set(state)
+
+        return state
+
+    def join(self, state: list[float]):
+        state[0] = max(state[0], self.deadline.get())
+
+
+def test_call_sees_every_caller_in_shared_context():
+    budget = Budget()
+    flight = SingleFlight("test_shared", budget)
+    seen = []
+
+    async def fetcher():
+        await asyncio.sleep(0.05)
+        seen.append(budget.deadline.get()[0])
+
+    async def caller(deadline: float):
+        budget.deadline.set(deadline)
+        await flight.do("key", fetcher)
+
+    async def run():
+        first = asyncio.create_task(caller(1.0))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, caller(3.0), caller(2.0))
+
+    asyncio.run(run())
+
+    assert seen == [3.0]
+
+
+def test_shared_roblox_budget_takes_highest_priority_and_latest_deadline():
+    pytest.importorskip("bloxlink_lib")
+    os.environ.setdefault("BOT_API_AUTH", "test")
+
+    from app.lib.roblox_limiter import SHARED_BUDGET, Priority, current_budget, roblox_budget
+
+    flight = SingleFlight("test_roblox_budget", SHARED_BUDGET)
+    seen = []
+
+    async def fetcher():
+        await asyncio.sleep(0.05)
+        seen.append(current_budget())
+
+    async def caller(priority: Priority, deadline: float | None):
+        with roblox_budget(priority, deadline):
+            await flight.do("key", fetcher)
+
+    async def run():
+        leader = asyncio.create_task(caller(Priority.BULK, 10.0))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(leader, caller(Priority.INTERACTIVE, 5.0), caller(Priority.BULK, 20.0))
+
+    asyncio.run(run())
+
+    assert seen == [(Priority.INTERACTIVE, 20.0)]
@@ -3,6 +3,8 @@ import logging
 from time import time
 import discord
 from .config import CONFIG
+from .bot_api import bot_api
+from .metrics import GATEWAY_EVENTS
 
 
 
@@ -67,6 +69,34 @@ class Bloxlink(discord.AutoShardedClient):
         return shard_range
 
 
+    def dispatch(self, event_name: str, /, *args, **kwargs):
+        """Count the event for the metrics endpoint before dispatching it."""
+
+        GATEWAY_EVENTS.inc(shard=self._event_shard(event_name, args), event=event_name)
+        super().dispatch(event_name, *args, **kwargs)
+
+    def _event_shard(self, event_name: str, args: tuple) -> int | str:
+        """Find the shard an event came from, based on its shard ID or the guild it belongs to."""
+
+        if not args:
+            return "none"
+
+        if event_name.startswith("shard_") and isinstance(args[0], int):
+            return args[0]
+
+        guild = args[0] if isinstance(args[0], discord.Guild) else getattr(args[0], "guild", None)
+
+        if isinstance(guild, discord.Guild):
+            return (guild.id >> 22) % (self.shard_count or 1)
+
+        return "none"
+
+    async def close(self):
+        """Close the gateway connection and the pooled bot API client."""
+
+        await super().close()
+        await bot_api.close()
+
     def __repr__(self):
         return "< Bloxlink Client >"
 
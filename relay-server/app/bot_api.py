@@ -0,0 +1,222 @@
+"""Shared, pooled HTTP client used for every relay -> bot API call."""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Literal, Type, TypeVar
+
+import aiohttp
+from bloxlink_lib import BaseModel, parse_into
+
+from .config import CONFIG
+from .metrics import BOT_API_REQUEST_SECONDS
+
+
+__all__ = ("bot_api", "BotAPIClient", "CircuitBreaker", "CircuitOpenError")
+
+T = TypeVar("T", bound=BaseModel)
+
+ID_SEGMENT = re.compile(r"/\d+")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the bot API circuit is open."""
+
+
+class CircuitBreaker:
+    """Fails requests fast while the bot API is unhealthy.
+
+    The circuit opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+    seconds have passed, a single trial request is let through (half-open). If it succeeds
+    the circuit closes again, otherwise it re-opens for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state: Literal["closed", "open", "half-open"] = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def before_request(self):
+        """Raises CircuitOpenError if the request should not be sent."""
+
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("The bot API circuit is open.")
+
+            self.state = "half-open"
+            self._trial_in_flight = False
+
+        if self.state == "half-open":
+            if self._trial_in_flight:
+                raise CircuitOpenError("The bot API circuit is half-open and a trial request is in flight.")
+
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """Record a healthy response."""
+
+        if self.state != "closed":
+            logging.info("Bot API circuit closed.")
+
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """Record a failed request (connection error, timeout or 5xx response)."""
+
+        self.failures += 1
+        self._trial_in_flight = False
+
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.error(f"Bot API circuit opened after {self.failures} failure(s).")
+
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Release a trial slot without recording an outcome, e.g. when the request was cancelled."""
+
+        self._trial_in_flight = False
+
+
+class BotAPIClient:
+    """A long-lived aiohttp session with connection pooling for the bot API."""
+
+    def __init__(
+        self,
+        base_url: str,
+        auth: str,
+        *,
+        limit_per_host: int,
+        keepalive_timeout: float,
+        dns_cache_ttl: int,
+        breaker: CircuitBreaker,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.auth = auth
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.breaker = breaker
+
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled session. Created lazily since it must be bound to the running loop."""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": self.auth},
+            )
+
+        return self._session
+
+    async def request(
+        self,
+        method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"],
+        path: str,
+        *,
+        body: dict | list | None = None,
+        timeout: float | None = CONFIG.BOT_API_TIMEOUT,
+    ) -> tuple[dict | list | str | None, aiohttp.ClientResponse]:
+        """Send a request to the bot API.
+
+        Returns the decoded JSON body (or the raw text if it is not JSON) and the response.
+        Raises CircuitOpenError without sending anything if the bot API is considered unhealthy.
+        """
+
+        self.breaker.before_request()
+
+        route = ID_SEGMENT.sub("/:id", path)
+        started_at = time.perf_counter()
+
+        try:
+            async with self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                json=body,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as response:
+                text = await response.text()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self.breaker.record_failure()
+            BOT_API_REQUEST_SECONDS.observe(
+                time.perf_counter() - started_at, method=method, route=route, status=ex.__class__.__name__
+            )
+            raise
+
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        BOT_API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at, method=method, route=route, status=response.status
+        )
+
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        try:
+            data = json.loads(text) if text else None
+        except json.JSONDecodeError:
+            data = text
+
+        return data, response
+
+    async def request_typed(
+        self,
+        model: Type[T],
+        method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"],
+        path: str,
+        *,
+        body: dict | list | None = None,
+        timeout: float | None = CONFIG.BOT_API_TIMEOUT,
+    ) -> tuple[T | None, aiohttp.ClientResponse]:
+        """Same as request(), but parses a successful response into the model. Returns None for the model otherwise."""
+
+        data, response = await self.request(method, path, body=body, timeout=timeout)
+
+        if response.ok and isinstance(data, dict):
+            return parse_into(data, model), response
+
+        return None, response
+
+    async def close(self):
+        """Close the session and its pooled connections."""
+
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+
+
+bot_api = BotAPIClient(
+    CONFIG.HTTP_BOT_API,
+    CONFIG.HTTP_BOT_AUTH,
+    limit_per_host=CONFIG.BOT_API_POOL_LIMIT,
+    keepalive_timeout=CONFIG.BOT_API_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=CONFIG.BOT_API_DNS_CACHE_TTL,
+    breaker=CircuitBreaker(
+        failure_threshold=CONFIG.BOT_API_BREAKER_THRESHOLD,
+        reset_timeout=CONFIG.BOT_API_BREAKER_RESET,
+    ),
+)
@@ -0,0 +1,61 @@
+"""Recording of incoming pubsub traffic, used to replay production load locally."""
+
+import gzip
+import json
+import logging
+import time
+from typing import Iterator
+
+
+__all__ = ("TrafficRecorder", "read_capture")
+
+
+class TrafficRecorder:
+    """Appends every received pubsub message to a gzip-compressed NDJSON file.
+
+    Each line is a `[timestamp_ns, channel, payload]` array, where payload is the raw
+    message data exactly as it was received.
+    """
+
+    FLUSH_EVERY = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._file = gzip.open(path, "at", encoding="utf-8")
+
+        logging.info(f"Capturing pubsub traffic to {path}")
+
+    def record(self, channel: str, payload: str | dict):
+        """Record a message."""
+
+        self._file.write(json.dumps([time.time_ns(), channel, payload], separators=(",", ":")))
+        self._file.write("\n")
+        self.recorded += 1
+
+        if self.recorded % self.FLUSH_EVERY == 0:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the capture file."""
+
+        self._file.close()
+
+
+def read_capture(path: str) -> Iterator[tuple[int, str, str | dict]]:
+    """Yields (timestamp_ns, channel, payload) from a capture file.
+
+    A capture that was not closed cleanly ends in a truncated gzip member; everything before it is still returned.
+    """
+
+    with gzip.open(path, "rt", encoding="utf-8") as capture_file:
+        try:
+            for line in capture_file:
+                if not line.endswith("\n"):
+                    break
+
+                timestamp, channel, payload = json.loads(line)
+                yield timestamp, channel, payload
+
+        except EOFError:
+            logging.warning(f"Capture {path} was truncated, stopping at the last complete record.")
@@ -18,6 +18,21 @@ class Config(BLOXLINK_CONFIG):
     HTTP_BOT_API: str
     HTTP_BOT_AUTH: str
 
+    # pooled bot API client
+    BOT_API_TIMEOUT: float = 10.0
+    BOT_API_POOL_LIMIT: int = 100
+    BOT_API_KEEPALIVE_TIMEOUT: float = 30.0
+    BOT_API_DNS_CACHE_TTL: int = 300
+    BOT_API_BREAKER_THRESHOLD: int = 5
+    BOT_API_BREAKER_RESET: float = 30.0
+
+    # event loop monitor, in seconds
+    LOOP_MONITOR_INTERVAL: float = 0.25
+    SLOW_CALLBACK_THRESHOLD: float = 0.5
+
+    # when set, incoming pubsub traffic is recorded to this file for replay
+    RELAY_CAPTURE_PATH: str | None = None
+
     PORT: int = 8020
     HOST: str = "0.0.0.0"
 
@@ -1,9 +1,9 @@
 from typing import Callable, get_type_hints
 from functools import wraps
-from bloxlink_lib import fetch_typed, StatusCodes
+from bloxlink_lib import StatusCodes
 import discord
 from app.types import PremiumResponse
-from app.config import CONFIG
+from app.bot_api import bot_api
 
 
 def guild_premium_required(fn: Callable):
@@ -27,10 +27,10 @@ def guild_premium_required(fn: Callable):
         if not guild:
             raise ValueError("Function must have either a member or guild parameter")
 
-        json_response, response = await fetch_typed(
+        json_response, response = await bot_api.request_typed(
             PremiumResponse,
-            f"{CONFIG.HTTP_BOT_API}/api/premium/guilds/{guild.id}",
-            headers={"Authorization": CONFIG.HTTP_BOT_AUTH},
+            "GET",
+            f"/api/premium/guilds/{guild.id}",
         )
 
         if response.status == StatusCodes.OK and json_response.premium:
@@ -1,7 +1,7 @@
 import logging
-from bloxlink_lib import BaseModel, fetch, StatusCodes
+from bloxlink_lib import BaseModel, StatusCodes
 from ..base import RelayEndpoint
-from ..config import CONFIG
+from ..bot_api import bot_api
 from ..redis import RedisRelayRequest
 from ..bloxlink import bloxlink
 from ..types import Response
@@ -36,16 +36,14 @@ class VerificationEndpoint(RelayEndpoint[Payload]):
             if not guild:
                 continue
 
-            text, response = await fetch(
+            text, response = await bot_api.request(
                 "POST",
-                f"{CONFIG.HTTP_BOT_API}/api/users/{user_id}/update",
-                headers={"Authorization": CONFIG.HTTP_BOT_AUTH},
+                f"/api/users/{user_id}/update",
                 body={
                     "guild_id": guild.id,
                     "member_id": user_id,
                     "dm_user": False
                 },
-                raise_on_failure=False
             )
 
             if response.status != StatusCodes.OK:
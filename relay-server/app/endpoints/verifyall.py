@@ -2,10 +2,10 @@ import json
 import asyncio
 import logging
 from datetime import timedelta, datetime
-from bloxlink_lib import parse_into, BaseModel, create_task_log_exception, StatusCodes, fetch, MemberSerializable
+from bloxlink_lib import parse_into, BaseModel, create_task_log_exception, StatusCodes, MemberSerializable
 from bloxlink_lib.database import redis
 import discord
-from ..config import CONFIG
+from ..bot_api import bot_api
 from ..base import RelayEndpoint
 from ..redis import RedisRelayRequest
 from ..bloxlink import bloxlink
@@ -75,18 +75,15 @@ class VerifyAllEndpoint(RelayEndpoint[Payload]):
             for i, member_chunk in enumerate(split_chunk, 1):
                 logging.debug(f"Sending chunk {i + 1} of {len(split_chunk)} chunks.")
 
-                text, response = await fetch(
+                text, response = await bot_api.request(
                     "POST",
-                    f"{CONFIG.HTTP_BOT_API}/api/users/update",
-                    headers={"Authorization": CONFIG.HTTP_BOT_AUTH},
+                    "/api/users/update",
                     body={
                         "guild_id": guild.id,
                         "members": [MemberSerializable.from_discordpy(m).model_dump() for m in member_chunk],
                         "nonce": nonce
                     },
-                    parse_as="JSON",
                     timeout=None,
-                    raise_on_failure=False
                 )
                 logging.debug(f"BOT SERVER RESPONSE: {response.status}, {text}")
 
@@ -1,9 +1,10 @@
 import logging
 import discord
-from bloxlink_lib import fetch_typed, StatusCodes
+from bloxlink_lib import StatusCodes
 from bloxlink_lib.database import update_guild_data
 from app.bloxlink import bloxlink
 from app.types import PremiumResponse
+from app.bot_api import bot_api
 from app.config import CONFIG
 
 
@@ -15,13 +16,13 @@ async def on_guild_join(guild: discord.Guild):
     await update_guild_data(guild.id, hasBot=True)
 
     if CONFIG.BOT_RELEASE == "PRO":
-        json_response, response = await fetch_typed(
+        json_response, response = await bot_api.request_typed(
             PremiumResponse,
-            f"{CONFIG.HTTP_BOT_API}/api/premium/guilds/{guild.id}",
-            headers={"Authorization": CONFIG.HTTP_BOT_AUTH},
+            "GET",
+            f"/api/premium/guilds/{guild.id}",
         )
 
-        if json_response.premium and "pro" in json_response.features:
+        if json_response and json_response.premium and "pro" in json_response.features:
             await update_guild_data(guild.id, proBot=True)
 
         logging.debug(f"[Guild join] premium check response: {response.status}, {json_response}")
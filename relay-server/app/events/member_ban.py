@@ -1,16 +1,49 @@
 import asyncio
 from bloxlink_lib import get_accounts, reverse_lookup
-from bloxlink_lib.database import fetch_guild_data
+from bloxlink_lib.database import fetch_guild_data, redis
 from discord import User, Member, Guild, NotFound
 from app.bloxlink import bloxlink
 from app.decorators import guild_premium_required
 
 
+# applies a ban event to the ban set bot-api loaded for the guild, if any, and journals it while
+# bot-api loads the set, so that it is replayed onto the loaded set
+UPDATE_GUILD_BANS = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    redis.call(ARGV[1], KEYS[1], ARGV[2])
+end
+
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    redis.call("RPUSH", KEYS[3], ARGV[1], ARGV[2])
+    redis.call("EXPIRE", KEYS[3], 600)
+end
+"""
+
+_update_guild_bans = redis.register_script(UPDATE_GUILD_BANS)
+
+
+async def update_guild_bans(guild_id: int, command: str, user_id: int):
+    """SADD or SREM the user to the ban set of the guild."""
+
+    await _update_guild_bans(
+        keys=[f"guild_bans:{guild_id}", f"guild_bans:{guild_id}:loading", f"guild_bans:{guild_id}:journal"],
+        args=[command, user_id],
+    )
+
+
 @bloxlink.event
-@guild_premium_required
 async def on_member_ban(guild: Guild, user: User | Member):
     """Event for when a user is banned from the guild."""
 
+    await update_guild_bans(guild.id, "SADD", user.id)
+
+    await ban_related_accounts(guild, user)
+
+
+@guild_premium_required
+async def ban_related_accounts(guild: Guild, user: User | Member):
+    """Ban the other accounts of the user if the guild has banRelatedAccounts enabled."""
+
     guild_data = await fetch_guild_data(guild.id, "banRelatedAccounts")
 
     if guild_data.banRelatedAccounts:
@@ -1,9 +1,9 @@
 import logging
-from bloxlink_lib import fetch, StatusCodes, MemberSerializable
+from bloxlink_lib import StatusCodes, MemberSerializable
 from bloxlink_lib.database import fetch_guild_data
 from discord import Member
 from app.bloxlink import bloxlink
-from app.config import CONFIG
+from app.bot_api import bot_api
 
 
 @bloxlink.event
@@ -13,14 +13,12 @@ async def on_member_join(member: Member):
     guild_data = await fetch_guild_data(member.guild.id, "autoRoles", "autoVerification", "highTrafficServer")
 
     if (guild_data.autoRoles or guild_data.autoVerification) and not guild_data.highTrafficServer:
-        json_response, response = await fetch(
+        json_response, response = await bot_api.request(
             "POST",
-            f"{CONFIG.HTTP_BOT_API}/api/users/{member.id}/{member.guild.id}/join",
-            headers={"Authorization": CONFIG.HTTP_BOT_AUTH},
+            f"/api/users/{member.id}/{member.guild.id}/join",
             body={
                 "member": MemberSerializable.from_discordpy(member).model_dump()
             },
-            parse_as="JSON"
         )
         logging.debug(f"Relay server member join response: {response.status}, {json_response}")
 
@@ -4,13 +4,22 @@ from bloxlink_lib.database import fetch_guild_data
 from discord import User, Member, Guild, NotFound, Object
 from app.bloxlink import bloxlink
 from app.decorators import guild_premium_required
+from app.events.member_ban import update_guild_bans
 
 
 @bloxlink.event
-@guild_premium_required
 async def on_member_unban(guild: Guild, user: User | Member):
     """Event for when a user is unbanned from the guild."""
 
+    await update_guild_bans(guild.id, "SREM", user.id)
+
+    await unban_related_accounts(guild, user)
+
+
+@guild_premium_required
+async def unban_related_accounts(guild: Guild, user: User | Member):
+    """Unban the other accounts of the user if the guild has unbanRelatedAccounts enabled."""
+
     guild_data = await fetch_guild_data(guild.id, "unbanRelatedAccounts")
 
     if guild_data.unbanRelatedAccounts:
@@ -0,0 +1,187 @@
+"""Minimal in-process metrics, rendered in the Prometheus text exposition format."""
+
+from bisect import bisect_left
+from collections import defaultdict
+
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "render_metrics",
+    "RELAY_REQUESTS",
+    "RELAY_HANDLE_SECONDS",
+    "RELAY_IN_FLIGHT",
+    "PUBSUB_DISPATCH_SECONDS",
+    "REPLY_PUBLISH_SECONDS",
+    "GATEWAY_EVENTS",
+    "BOT_API_REQUEST_SECONDS",
+)
+
+REGISTRY: list["Metric"] = []
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base class for a metric family with a fixed set of label names."""
+
+    type: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str | int]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        """The sample lines of this metric."""
+
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        """Render the metric family, including its HELP and TYPE lines."""
+
+        return "\n".join((
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ))
+
+
+class Counter(Metric):
+    """A monotonically increasing value."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: str | int):
+        """Increase the counter."""
+
+        self._values[self._key(labels)] += amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str | int):
+        """Decrease the gauge."""
+
+        self._values[self._key(labels)] -= amount
+
+    def set(self, value: float, **labels: str | int):
+        """Set the gauge to a value."""
+
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: str | int):
+        """Record an observation."""
+
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def samples(self) -> list[str]:
+        lines: list[str] = []
+
+        for key, counts in self._counts.items():
+            cumulative = 0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+
+        return lines
+
+
+def render_metrics() -> str:
+    """Render every registered metric."""
+
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+RELAY_REQUESTS = Counter(
+    "relay_requests_total",
+    "Relay requests received over pubsub, by endpoint and outcome.",
+    ("endpoint", "status"),
+)
+RELAY_HANDLE_SECONDS = Histogram(
+    "relay_request_handle_seconds",
+    "Time from receiving a relay request to finishing it, including publishing the reply.",
+    ("endpoint",),
+)
+RELAY_IN_FLIGHT = Gauge(
+    "relay_requests_in_flight",
+    "Relay requests currently being handled.",
+    ("endpoint",),
+)
+PUBSUB_DISPATCH_SECONDS = Histogram(
+    "relay_pubsub_dispatch_seconds",
+    "Time from reading a message off the pubsub connection until its handler starts. Does not include the time the message spent in Redis.",
+)
+REPLY_PUBLISH_SECONDS = Histogram(
+    "relay_reply_publish_seconds",
+    "Time spent publishing a reply to Redis.",
+)
+GATEWAY_EVENTS = Counter(
+    "relay_gateway_events_total",
+    "Gateway events dispatched, by shard and event name.",
+    ("shard", "event"),
+)
+BOT_API_REQUEST_SECONDS = Histogram(
+    "relay_bot_api_request_seconds",
+    "Latency of outbound calls to the bot API, by route and status.",
+    ("method", "route", "status"),
+)
@@ -0,0 +1,121 @@
+"""Event-loop lag sampling, task accounting and slow-callback capture for the relay."""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from bloxlink_lib import create_task_log_exception
+
+from .config import CONFIG
+
+
+__all__ = ("LoopMonitor", "monitor")
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes up and captures what is blocking it.
+
+    A coroutine sleeps for `interval` seconds at a time and records how late it woke up
+    (the loop lag). Each wake-up is also a heartbeat for a watchdog thread: if no heartbeat
+    arrives within `slow_callback_threshold` seconds, the loop is stuck in a callback and
+    the watchdog logs the stack of the loop thread so the culprit can be identified.
+    """
+
+    def __init__(self, interval: float, slow_callback_threshold: float, history: int = 20):
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+
+        self.lag: float = 0.0
+        self.max_lag: float = 0.0
+        self.recent_lags: deque[float] = deque(maxlen=int(60 / interval) or 1)
+        self.slow_callbacks: deque[dict] = deque(maxlen=history)
+
+        self._loop_thread_id: int | None = None
+        self._last_beat = time.monotonic()
+        self._reported_beat: float | None = None
+
+    async def run(self):
+        """Sample the loop lag forever and start the watchdog thread."""
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+        while True:
+            expected_at = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            self._last_beat = now
+
+            self.lag = max(now - expected_at, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.recent_lags.append(self.lag)
+
+    def _watchdog(self):
+        """Runs in a separate thread. Logs the loop thread's stack when a callback blocks for too long."""
+
+        while True:
+            time.sleep(self.slow_callback_threshold / 2)
+
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+
+            if blocked_for < self.slow_callback_threshold or self._reported_beat == last_beat:
+                continue
+
+            self._reported_beat = last_beat
+
+            frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+
+            self.slow_callbacks.append({
+                "detected_at": time.time(),
+                "blocked_for": round(blocked_for, 3),
+                "stack": stack,
+            })
+
+            logging.warning(
+                f"Event loop blocked for over {blocked_for:.3f}s. Current stack of the loop thread:\n{stack}"
+            )
+
+    @staticmethod
+    def task_counts() -> dict[str, int]:
+        """Count the live tasks on the running loop, grouped by coroutine name."""
+
+        counts = Counter()
+
+        for task in asyncio.all_tasks():
+            coro = task.get_coro()
+            counts[getattr(coro, "__qualname__", None) or task.get_name()] += 1
+
+        return dict(counts.most_common())
+
+    def snapshot(self) -> dict:
+        """A JSON-serializable view of the loop health."""
+
+        recent_lags = sorted(self.recent_lags)
+
+        return {
+            "lag": round(self.lag, 6),
+            "max_lag": round(self.max_lag, 6),
+            "p99_lag": round(recent_lags[min(int(len(recent_lags) * 0.99), len(recent_lags) - 1)], 6) if recent_lags else 0.0,
+            "interval": self.interval,
+            "slow_callback_threshold": self.slow_callback_threshold,
+            "task_count": len(asyncio.all_tasks()),
+            "tasks": self.task_counts(),
+            "slow_callbacks": list(self.slow_callbacks),
+        }
+
+
+monitor = LoopMonitor(
+    interval=CONFIG.LOOP_MONITOR_INTERVAL,
+    slow_callback_threshold=CONFIG.SLOW_CALLBACK_THRESHOLD,
+)
+
+create_task_log_exception(monitor.run())
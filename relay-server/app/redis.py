@@ -7,8 +7,17 @@ from redis import exceptions as redis_exceptions
 
 from bloxlink_lib import find, BaseModel, parse_into, create_task_log_exception
 from bloxlink_lib.database import redis
+from .config import CONFIG
+from .capture import TrafficRecorder
 from .base import discover_endpoints, RelayEndpoint, RelayPath, RELAY_ENDPOINTS
 from .bloxlink import bloxlink
+from .metrics import (
+    RELAY_REQUESTS,
+    RELAY_HANDLE_SECONDS,
+    RELAY_IN_FLIGHT,
+    PUBSUB_DISPATCH_SECONDS,
+    REPLY_PUBLISH_SECONDS,
+)
 
 
 redis_pubsub = redis.pubsub()
@@ -35,7 +44,10 @@ class RedisRelayRequest(Generic[T]):
 
         try:
             response_data = data.model_dump_json() if isinstance(data, BaseModel) else json.dumps({"nonce": self.nonce, "data": data, "cluster_id": bloxlink.node_id})
+
+            publish_started_at = time.perf_counter()
             await redis.publish(working_channel, response_data)
+            REPLY_PUBLISH_SECONDS.observe(time.perf_counter() - publish_started_at)
 
             published_at = time.time_ns()
             logging.info(
@@ -69,11 +81,17 @@ class RedisMessageData(BaseModel):
     nonce: str
     data: dict | None
 
-async def handle_message(channel: str, message_data: RedisMessageData):
-    """Handles a message from the pubsub channel."""
+async def handle_message(channel: str, message_data: RedisMessageData, read_at: float | None = None):
+    """Handles a message from the pubsub channel.
+
+    read_at is the time.perf_counter() value at which the message was read off the pubsub connection.
+    """
 
     received_at = time.time_ns()
 
+    if read_at is not None:
+        PUBSUB_DISPATCH_SECONDS.observe(time.perf_counter() - read_at)
+
     relay_channel = RelayPath(channel)
     endpoint_name: str = relay_channel[0]
 
@@ -84,8 +102,12 @@ async def handle_message(channel: str, message_data: RedisMessageData):
 
     if not endpoint:
         logging.warning("Ignored request, no suitable endpoints.")
+        RELAY_REQUESTS.inc(endpoint=endpoint_name, status="ignored")
         return
 
+    status = "error"
+    RELAY_IN_FLIGHT.inc(endpoint=endpoint_name)
+
     try:
         request = RedisRelayRequest(received_at, nonce, payload)
         response = await endpoint.handle(request)
@@ -93,7 +115,10 @@ async def handle_message(channel: str, message_data: RedisMessageData):
         if response:
             await request.respond(response)
 
+        status = "ok"
+
     except TimeoutError:
+        status = "timeout"
         logging.error(f"Endpoint execution: {channel} exceeded process time!")
     # TODO: Catch few types of redis exceptions
 
@@ -103,6 +128,11 @@ async def handle_message(channel: str, message_data: RedisMessageData):
     except Exception as ex: # pylint: disable=broad-except
         logging.error(f"Endpoint {channel}: {ex.__class__.__name__} {ex}")
 
+    finally:
+        RELAY_IN_FLIGHT.dec(endpoint=endpoint_name)
+        RELAY_REQUESTS.inc(endpoint=endpoint_name, status=status)
+        RELAY_HANDLE_SECONDS.observe((time.time_ns() - received_at) / 1_000_000_000, endpoint=endpoint_name)
+
 
 async def run():
     """Run the Redis pubsub listener."""
@@ -117,22 +147,33 @@ async def run():
 
     logging.info("Listening for messages.")
 
-    while True:
-        try:
-            message = await redis_pubsub.get_message(ignore_subscribe_messages=True)
+    recorder = TrafficRecorder(CONFIG.RELAY_CAPTURE_PATH) if CONFIG.RELAY_CAPTURE_PATH else None
+
+    try:
+        while True:
+            try:
+                message = await redis_pubsub.get_message(ignore_subscribe_messages=True)
+
+                if message:
+                    read_at = time.perf_counter()
+                    parsed_message = RedisMessage(**message)
+                    print(parsed_message)
+
+                    if parsed_message.type == "message":
+                        if recorder:
+                            recorder.record(parsed_message.channel, parsed_message.data)
 
-            if message:
-                parsed_message = RedisMessage(**message)
-                print(parsed_message)
+                        create_task_log_exception(handle_message(parsed_message.channel, RedisMessageData(**json.loads(parsed_message.data)), read_at))
 
-                if parsed_message.type == "message":
-                    create_task_log_exception(handle_message(parsed_message.channel, RedisMessageData(**json.loads(parsed_message.data))))
+            except redis_exceptions.ConnectionError as e:
+                logging.error(f"Redis connection error: {e}")
+                await asyncio.sleep(5)
 
-        except redis_exceptions.ConnectionError as e:
-            logging.error(f"Redis connection error: {e}")
-            await asyncio.sleep(5)
+            await asyncio.sleep(0.1)
 
-        await asyncio.sleep(0.1)
+    finally:
+        if recorder:
+            recorder.close()
 
 
 create_task_log_exception(run())
@@ -2,10 +2,12 @@
 
 
 import uvicorn
-from blacksheep import Application, get, json
+from blacksheep import Application, get, json, text
 from bloxlink_lib import create_task_log_exception
 
 from ..config import CONFIG
+from ..monitor import monitor
+from ..metrics import render_metrics
 
 app = Application()
 
@@ -18,6 +20,20 @@ async def index():
     return json({"message": "Relay server is running!"})
 
 
+@get("/loop")
+async def loop_health():
+    """Event loop lag, live task counts and recently captured slow callbacks."""
+
+    return json(monitor.snapshot())
+
+
+@get("/metrics")
+async def metrics():
+    """Metrics in the Prometheus text exposition format."""
+
+    return text(render_metrics())
+
+
 async def main():
     """Starts the server."""
 
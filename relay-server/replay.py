@@ -0,0 +1,175 @@
+"""
+Replays captured pubsub traffic against a local Redis to load test the relay.
+
+Record traffic by running the relay with RELAY_CAPTURE_PATH set, then point REDIS_URL at a
+local Redis and run:
+
+    python replay.py capture.ndjson.gz [--speed original|max] [--external]
+
+By default the relay listener runs in this process with a fake gateway client, so no Discord
+connection is needed. Use --external to replay against a relay that is already running.
+Latency is measured from publishing each request until its REPLY:{nonce} response arrives.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from types import SimpleNamespace
+
+from discord.utils import snowflake_time
+from bloxlink_lib.database import redis
+from app.capture import read_capture
+
+
+class FakeGuild(SimpleNamespace):
+    """A guild with just enough surface for the relay endpoints to respond."""
+
+    def __init__(self, guild_id: int):
+        super().__init__(
+            id=guild_id,
+            name=f"Replay Guild {guild_id}",
+            icon=None,
+            splash=None,
+            owner_id=0,
+            members=[],
+            created_at=snowflake_time(guild_id),
+            roles=[
+                SimpleNamespace(
+                    id=guild_id + position,
+                    name=f"Role {position}",
+                    color="#000000",
+                    hoist=False,
+                    position=position,
+                    permissions=SimpleNamespace(value=0),
+                    managed=False,
+                )
+                for position in range(10)
+            ],
+        )
+
+    def by_category(self) -> list:
+        return []
+
+    async def chunk(self) -> list:
+        return []
+
+
+class FakeGateway:
+    """Stands in for the gateway cache: every guild exists and is empty."""
+
+    def __init__(self):
+        self.guilds: dict[int, FakeGuild] = {}
+
+    def get_guild(self, guild_id: int) -> FakeGuild:
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = FakeGuild(guild_id)
+
+        return self.guilds[guild_id]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not sorted_values:
+        return 0.0
+
+    return sorted_values[min(int(len(sorted_values) * pct / 100), len(sorted_values) - 1)]
+
+
+async def collect_replies(pending: dict[str, float], latencies: list[float]):
+    """Match REPLY:{nonce} messages to the requests that were published."""
+
+    pubsub = redis.pubsub()
+    await pubsub.psubscribe("REPLY:*")
+
+    try:
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+            if not message or message["type"] != "pmessage":
+                continue
+
+            nonce = message["channel"].split(":", 1)[1]
+            published_at = pending.pop(nonce, None)
+
+            if published_at is not None:
+                latencies.append(time.perf_counter() - published_at)
+    finally:
+        await pubsub.aclose()
+
+
+async def replay(path: str, speed: str, external: bool, drain_timeout: float):
+    """Publish the captured messages and report reply latency percentiles."""
+
+    if not external:
+        from app.bloxlink import bloxlink  # pylint: disable=import-outside-toplevel
+
+        bloxlink.get_guild = FakeGateway().get_guild
+
+        import app.redis  # pylint: disable=import-outside-toplevel,unused-import # starts the relay listener
+
+        await asyncio.sleep(1)  # give the listener time to subscribe
+
+    pending: dict[str, float] = {}
+    latencies: list[float] = []
+    collector = asyncio.create_task(collect_replies(pending, latencies))
+    await asyncio.sleep(0.5)
+
+    sent = 0
+    first_timestamp: int | None = None
+    started_at = time.perf_counter()
+
+    for timestamp, channel, payload in read_capture(path):
+        if speed == "original":
+            first_timestamp = first_timestamp or timestamp
+            delay = (timestamp - first_timestamp) / 1_000_000_000 - (time.perf_counter() - started_at)
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        message = json.loads(payload) if isinstance(payload, str) else payload
+        nonce = f"replay-{sent}"
+        message["nonce"] = nonce
+
+        pending[nonce] = time.perf_counter()
+        await redis.publish(channel, json.dumps(message))
+        sent += 1
+
+    publish_duration = time.perf_counter() - started_at
+
+    drain_deadline = time.perf_counter() + drain_timeout
+    while pending and time.perf_counter() < drain_deadline:
+        await asyncio.sleep(0.1)
+
+    collector.cancel()
+
+    latencies.sort()
+    print(f"Published {sent} messages in {publish_duration:.2f}s ({sent / (publish_duration or 1):.1f}/s)")
+    print(f"Replies: {len(latencies)}, no reply: {len(pending)}")
+
+    for pct in (50, 90, 99, 99.9):
+        print(f"p{pct}: {percentile(latencies, pct) * 1000:.2f}ms")
+
+    if latencies:
+        print(f"max: {latencies[-1] * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="Capture file recorded with RELAY_CAPTURE_PATH.")
+    parser.add_argument("--speed", choices=("original", "max"), default="original",
+                        help="Keep the original spacing between messages, or publish as fast as possible.")
+    parser.add_argument("--external", action="store_true",
+                        help="Replay against an already running relay instead of an in-process one.")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="Seconds to wait for outstanding replies after publishing.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(replay(args.capture, args.speed, args.external, args.drain_timeout))
+
+
+if __name__ == "__main__":
+    main()
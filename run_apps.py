@@ -1,7 +1,9 @@
-import subprocess
+import asyncio
+import codecs
 import signal
 import sys
 import os
+import time
 
 APPS = {
     "bot-api": ("poetry run python bot-api", {
@@ -12,48 +14,162 @@ APPS = {
     })
 }
 
+# "on-failure" restarts apps that exit with a non-zero code, "always" also restarts
+# apps that exit cleanly, and "never" leaves exited apps stopped.
+RESTART_POLICY = os.environ.get("RESTART_POLICY", "on-failure")
+RESTART_BACKOFF_INITIAL = 1.0
+RESTART_BACKOFF_MAX = 30.0
+RESTART_BACKOFF_RESET_AFTER = 60.0  # an app that ran this long starts over at the initial backoff
+SHUTDOWN_GRACE_PERIOD = 10.0
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
 # ANSI escape codes for colors
 GREEN_START = "\033[0;32m"
+RED_START = "\033[0;31m"
 COLOR_END = "\033[0m"
 
-processes: dict[str, subprocess.Popen] = {}
+processes: dict[str, asyncio.subprocess.Process] = {}
+
+
+def log(message: str, color: str = GREEN_START):
+    print(f"{color}{message}{COLOR_END}", flush=True)
+
+
+def send_signal(process: asyncio.subprocess.Process, sig: signal.Signals):
+    """Signal the app's whole process group, since the command runs through a shell and poetry."""
+
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+    except ProcessLookupError:
+        pass
+
+
+async def pipe_output(app_name: str, stream: asyncio.StreamReader, output):
+    """Copy the app's output, prefixing every line with the app name.
+
+    The output is read in chunks, so lines of any length are copied whole. Never raises, so a
+    problem with the output cannot take the supervisor down.
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    at_line_start = True
+
+    try:
+        while chunk := await stream.read(OUTPUT_CHUNK_SIZE):
+            for piece in decoder.decode(chunk).splitlines(keepends=True):
+                output.write(f"[{app_name}] {piece}" if at_line_start else piece)
+                at_line_start = piece.endswith(("\n", "\r"))
+
+            output.flush()
+    except Exception as e:  # pylint: disable=broad-except
+        log(f"Copying the output of {app_name} failed: {e!r}", RED_START)
+
+        # keep draining, or the app blocks once the pipe is full
+        while await stream.read(OUTPUT_CHUNK_SIZE):
+            pass
+
+
+async def supervise(app_name: str, command: str, env: dict[str, str], stopping: asyncio.Event):
+    """Run the app, waiting on its exit and restarting it according to RESTART_POLICY."""
+
+    backoff = RESTART_BACKOFF_INITIAL
+
+    while not stopping.is_set():
+        log(f"Starting {app_name}...")
+        started_at = time.monotonic()
 
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=dict(os.environ, **(env or {})),
+            start_new_session=True,
+        )
+        processes[app_name] = process
 
-def terminate_processes(signal, frame):
-    """Terminate all processes and exit with code 0"""
+        if stopping.is_set():
+            # stopped while the app was starting, after terminate_processes() signalled the others
+            send_signal(process, signal.SIGTERM)
+            asyncio.get_running_loop().call_later(SHUTDOWN_GRACE_PERIOD, send_signal, process, signal.SIGKILL)
+
+        await asyncio.gather(
+            pipe_output(app_name, process.stdout, sys.stdout),
+            pipe_output(app_name, process.stderr, sys.stderr),
+        )
+        return_code = await process.wait()
+        del processes[app_name]
+
+        if stopping.is_set():
+            log(f"{app_name} stopped.")
+            break
+
+        if return_code == 0:
+            log(f"{app_name} completed successfully.")
+
+            if RESTART_POLICY != "always":
+                break
+        else:
+            log(f"{app_name} exited with code {return_code}.", RED_START)
+
+            if RESTART_POLICY == "never":
+                break
+
+        if time.monotonic() - started_at >= RESTART_BACKOFF_RESET_AFTER:
+            backoff = RESTART_BACKOFF_INITIAL
+
+        log(f"Restarting {app_name} in {backoff:.1f}s...")
+
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=backoff)
+        except TimeoutError:
+            pass
+
+        backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+
+async def terminate_processes():
+    """Ask every app to stop, then kill any that are still running after the grace period."""
 
     for process in processes.values():
-        process.terminate()
+        send_signal(process, signal.SIGTERM)
+
+    running = [asyncio.create_task(process.wait()) for process in processes.values()]
+
+    if not running:
+        return
+
+    _, still_running = await asyncio.wait(running, timeout=SHUTDOWN_GRACE_PERIOD)
+
+    if still_running:
+        for app_name, process in dict(processes).items():
+            log(f"{app_name} did not stop in time, killing it.", RED_START)
+            send_signal(process, signal.SIGKILL)
+
 
-    sys.exit(0)
+async def main():
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
 
+    # Stop gracefully on Ctrl+C (SIGINT) as well as when the supervisor itself is terminated (SIGTERM)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
 
-# Register a signal handler to capture termination signal (SIGINT)
-signal.signal(signal.SIGINT, terminate_processes)
+    supervisors = asyncio.gather(*(
+        supervise(app_name, command, env, stopping) for app_name, (command, env) in APPS.items()
+    ))
+    stop_requested = asyncio.create_task(stopping.wait())
 
-# Start all apps
-for app_name, app_data in APPS.items():
-    print(f"{GREEN_START}Starting {app_name}...{COLOR_END}")
-    process = subprocess.Popen(
-        app_data[0],
-        shell=True,
-        stdout=sys.stdout,
-        stderr=sys.stderr,
-        universal_newlines=True,
-        env=dict(os.environ, **(app_data[1] or {}))
-    )
-    processes[app_name] = process
+    await asyncio.wait((supervisors, stop_requested), return_when=asyncio.FIRST_COMPLETED)
 
-# Continuously check and print errors if any
-while processes:
-    for app_name, process in dict(processes).items():
-        return_code = process.poll()
+    if stopping.is_set():
+        await terminate_processes()
 
-        if return_code is not None:
-            print(f"{GREEN_START}{app_name} completed successfully.{COLOR_END}")
+    stop_requested.cancel()
+    await supervisors
 
-            del processes[app_name]
 
-# Ensure all processes are terminated before exiting
-for process in processes.values():
-    process.terminate()
+if __name__ == "__main__":
+    asyncio.run(main())